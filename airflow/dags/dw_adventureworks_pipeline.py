@@ -15,10 +15,18 @@ Fluxo:
     5. Validação de qualidade de dados
 """
 
-from datetime import datetime, timedelta
-from typing import Dict, List, Any
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Any
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import chain
+from queue import Empty, Queue
+import csv
+import hashlib
+import io
 import logging
 import os
+import threading
 from decimal import Decimal
 
 from airflow import DAG
@@ -26,7 +34,8 @@ from airflow.operators.empty import EmptyOperator
 from airflow.operators.python import PythonOperator
 import pymssql
 import psycopg2
-from psycopg2.extras import execute_batch
+from psycopg2 import sql
+from psycopg2.pool import ThreadedConnectionPool
 
 # Configuração de logging
 logger = logging.getLogger(__name__)
@@ -53,8 +62,10 @@ class ConfiguracaoBancoDados:
         'password': os.getenv("DW_PASSWORD", "dw_password")
     }
 
-# Mapeamento de tabelas
+# Mapeamento de tabelas (maiores primeiro para equilibrar a extração paralela)
 MAPA_TABELAS = {
+    "Sales.SalesOrderDetail": "stage_pedidos_detalhe",
+    "Sales.SalesOrderHeader": "stage_pedidos_header",
     "Sales.Customer": "stage_clientes",
     "Person.Person": "stage_pessoas",
     "Production.Product": "stage_produtos",
@@ -63,51 +74,260 @@ MAPA_TABELAS = {
     "Sales.SalesTerritory": "stage_territorios",
     "Sales.SalesPerson": "stage_vendedores",
     "HumanResources.Employee": "stage_funcionarios",
-    "Sales.SpecialOffer": "stage_ofertas",
-    "Sales.SalesOrderHeader": "stage_pedidos_header",
-    "Sales.SalesOrderDetail": "stage_pedidos_detalhe"
+    "Sales.SpecialOffer": "stage_ofertas"
+}
+
+# Chave natural de cada tabela staging: índice único criado após a carga
+# garante que os joins das dimensões não duplicam linhas (dispensa DISTINCT)
+CHAVES_STAGING = {
+    "stage_pedidos_detalhe": "SalesOrderDetailID",
+    "stage_pedidos_header": "SalesOrderID",
+    "stage_clientes": "CustomerID",
+    "stage_pessoas": "BusinessEntityID",
+    "stage_produtos": "ProductID",
+    "stage_subcategorias": "ProductSubcategoryID",
+    "stage_categorias": "ProductCategoryID",
+    "stage_territorios": "TerritoryID",
+    "stage_vendedores": "BusinessEntityID",
+    "stage_funcionarios": "BusinessEntityID",
+    "stage_ofertas": "SpecialOfferID",
+}
+
+# Tabelas extraídas apenas acima do watermark (coluna crescente na origem);
+# o watermark só avança após a carga da fato
+TABELAS_INCREMENTAIS = {
+    "Sales.SalesOrderHeader": "SalesOrderID",
+    "Sales.SalesOrderDetail": "SalesOrderID",
+}
+
+# Parâmetros de extração
+TAMANHO_AMOSTRA_TIPOS = 1000
+TAMANHO_LOTE_EXTRACAO = 10000
+MAX_WORKERS_STAGING = 4
+
+# Pool de conexões do DW (workers de staging + thread principal)
+# Cada tarefa roda em processo próprio (CeleryExecutor), então o pool só vive durante a
+# tarefa: uma conexão aberta de início (a maioria das tarefas usa só uma) e as demais
+# sob demanda para os workers de staging, fechadas ao serem devolvidas
+MIN_CONEXOES_DESTINO = 1
+MAX_CONEXOES_DESTINO = 8
+_pool_destino = None
+_trava_pool_destino = threading.Lock()
+
+# Tabelas analisadas antes da carga da fato (joins em nk_* usam os índices únicos)
+TABELAS_ESTATISTICAS_FATO = [
+    "staging.stage_pedidos_header",
+    "staging.stage_pedidos_detalhe",
+    "dw.dim_cliente",
+    "dw.dim_produto",
+    "dw.dim_regiao",
+    "dw.dim_vendedor",
+    "dw.dim_oferta",
+]
+
+# Códigos de tipo do pymssql em cursor.description (STRING, BINARY, NUMBER, DATETIME, DECIMAL)
+CODIGO_MSSQL_STRING, CODIGO_MSSQL_BINARY, CODIGO_MSSQL_NUMBER = 1, 2, 3
+CODIGO_MSSQL_DATETIME, CODIGO_MSSQL_DECIMAL = 4, 5
+
+TIPO_PG_POR_CODIGO_MSSQL = {
+    CODIGO_MSSQL_STRING: "TEXT",
+    CODIGO_MSSQL_BINARY: "TEXT",
+    CODIGO_MSSQL_DATETIME: "TIMESTAMP",
+    CODIGO_MSSQL_DECIMAL: "NUMERIC(18,4)",
+}
+
+# Inferência de tipos: cada tipo Python liga um bit da máscara
+BIT_INTEGER, BIT_NUMERIC, BIT_DOUBLE, BIT_BOOLEAN, BIT_TIMESTAMP = 1, 2, 4, 8, 16
+
+BITS_TIPO_PYTHON = {
+    bool: BIT_BOOLEAN,
+    int: BIT_INTEGER,
+    float: BIT_DOUBLE,
+    Decimal: BIT_NUMERIC,
+    datetime: BIT_TIMESTAMP,
+    date: BIT_TIMESTAMP,
+}
+
+TIPO_POR_MASCARA = {
+    0: "TEXT",
+    BIT_INTEGER: "INTEGER",
+    BIT_NUMERIC: "NUMERIC(18,4)",
+    BIT_INTEGER | BIT_NUMERIC: "NUMERIC(18,4)",
+    BIT_DOUBLE: "DOUBLE PRECISION",
+    BIT_BOOLEAN: "BOOLEAN",
+    BIT_TIMESTAMP: "TIMESTAMP",
 }
 
 # ============================================================
 # FUNÇÕES AUXILIARES
 # ============================================================
 def obter_conexao_fonte():
-    """Retorna conexão com banco de dados fonte"""
-    return pymssql.connect(**ConfiguracaoBancoDados.FONTE)
+    """Retorna conexão com banco de dados fonte (somente leitura, em autocommit)"""
+    return pymssql.connect(
+        **ConfiguracaoBancoDados.FONTE,
+        charset='UTF-8',
+        as_dict=False,
+        autocommit=True
+    )
 
+def obter_pool_destino() -> ThreadedConnectionPool:
+    """
+    Pool de conexões do DW criado uma vez por processo de tarefa
+    Limita as conexões simultâneas das threads de staging ao MAX_CONEXOES_DESTINO
+    """
+    global _pool_destino
+    with _trava_pool_destino:
+        if _pool_destino is None:
+            _pool_destino = ThreadedConnectionPool(
+                MIN_CONEXOES_DESTINO, MAX_CONEXOES_DESTINO,
+                **ConfiguracaoBancoDados.DESTINO
+            )
+        return _pool_destino
+
+@contextmanager
 def obter_conexao_destino():
-    """Retorna conexão com Data Warehouse"""
-    return psycopg2.connect(**ConfiguracaoBancoDados.DESTINO)
+    """
+    Empresta uma conexão do pool do DW
+    Commit ao sair sem erro e rollback em caso de exceção; a sessão é restaurada
+    (autocommit e SETs) antes de voltar ao pool
+    """
+    pool = obter_pool_destino()
+    conn = pool.getconn()
+    try:
+        with conn:
+            yield conn
+    finally:
+        descartar = bool(conn.closed)
+        if not descartar:
+            try:
+                conn.reset()
+                conn.autocommit = False
+            except psycopg2.Error:
+                descartar = True
+        pool.putconn(conn, close=descartar)
 
-def inferir_tipo_coluna(amostras: List[Any]) -> str:
+def executar_carga_dimensao(nome_dimensao: str, comando_sql: str) -> int:
+    """
+    Executa o upsert de uma dimensão em uma única ida ao servidor
+    Em autocommit o statement é atômico sozinho, sem BEGIN/COMMIT separados
+    """
+    logger.info(f"Carregando dimensão {nome_dimensao}")
+    
+    with obter_conexao_destino() as conn:
+        conn.autocommit = True
+        
+        with conn.cursor() as cursor:
+            cursor.execute(comando_sql)
+            logger.info(f"Dimensão {nome_dimensao} atualizada: {cursor.rowcount} registros novos ou alterados")
+            return cursor.rowcount
+
+def inferir_tipo_coluna(amostras: Iterable[Any]) -> str:
     """Infere o tipo PostgreSQL baseado em amostras de dados"""
-    tipos_encontrados = set()
+    mascara = 0
     
     for valor in amostras:
         if valor is None:
             continue
-        elif isinstance(valor, bool):
-            tipos_encontrados.add("BOOLEAN")
-        elif isinstance(valor, int):
-            tipos_encontrados.add("INTEGER")
-        elif isinstance(valor, float):
-            tipos_encontrados.add("DOUBLE PRECISION")
-        elif isinstance(valor, Decimal):
-            tipos_encontrados.add("NUMERIC(18,4)")
-        elif isinstance(valor, (datetime, datetime)):
-            tipos_encontrados.add("TIMESTAMP")
+        
+        # Tipo exato: bool não pode cair na regra de int
+        bit = BITS_TIPO_PYTHON.get(type(valor))
+        if bit is None:
+            return "TEXT"
+        mascara |= bit
+    
+    # Combinações sem tipo comum (ex.: INTEGER + TIMESTAMP) viram TEXT
+    return TIPO_POR_MASCARA.get(mascara, "TEXT")
+
+def mapear_tipos_colunas(descricao: List[tuple], amostra: List[tuple]) -> Dict[str, str]:
+    """
+    Mapeia as colunas do cursor pymssql para tipos PostgreSQL
+    O código NUMBER agrupa int, bit e float, então apenas essas colunas usam a amostra
+    """
+    tipos_coluna = {}
+    
+    for idx, desc in enumerate(descricao):
+        coluna, codigo_tipo = desc[0], desc[1]
+        
+        if codigo_tipo == CODIGO_MSSQL_NUMBER:
+            tipo = inferir_tipo_coluna(r[idx] for r in amostra)
+            # Sem amostra ou int/float misturados: DOUBLE PRECISION comporta ambos
+            tipos_coluna[coluna] = "DOUBLE PRECISION" if tipo == "TEXT" else tipo
         else:
-            tipos_encontrados.add("TEXT")
-    
-    # Retorna tipo mais genérico se houver conflito
-    if not tipos_encontrados:
-        return "TEXT"
-    elif len(tipos_encontrados) == 1:
-        return tipos_encontrados.pop()
-    elif tipos_encontrados <= {"INTEGER", "NUMERIC(18,4)"}:
-        return "NUMERIC(18,4)"
-    else:
-        return "TEXT"
+            tipos_coluna[coluna] = TIPO_PG_POR_CODIGO_MSSQL.get(codigo_tipo, "TEXT")
+    
+    return tipos_coluna
+
+def converter_binarios(lote: List[tuple], indices_binarios: List[int]) -> List[tuple]:
+    """
+    Converte os bytes das colunas BINARY para o literal hexadecimal
+    O código BINARY também cobre uniqueidentifier (rowguid), que o pymssql entrega
+    como uuid.UUID: valores que não são bytes seguem intactos para o str() do csv.writer
+    """
+    convertidos = []
+    for registro in lote:
+        registro = list(registro)
+        for idx in indices_binarios:
+            valor = registro[idx]
+            if isinstance(valor, (bytes, bytearray)):
+                registro[idx] = "\\x" + valor.hex()
+        convertidos.append(registro)
+    return convertidos
+
+def iterar_lotes(cursor) -> Iterator[List[tuple]]:
+    """Percorre o resultado do cursor em lotes de cursor.arraysize com fetchmany"""
+    while True:
+        lote = cursor.fetchmany()
+        if not lote:
+            break
+        yield lote
+
+
+class FluxoCopy:
+    """
+    Objeto file-like consumido pelo copy_expert (COPY ... WITH (FORMAT CSV))
+    Codifica lote a lote com o csv.writer (implementado em C), mantendo memória limitada
+    
+    QUOTE_NOTNULL (Python 3.12+): todo valor sai entre aspas (texto vazio vira "") e
+    None sai vazio sem aspas, que o COPY CSV interpreta como NULL
+    """
+    
+    def __init__(self, lotes: Iterable[List[tuple]], indices_binarios: List[int] = None):
+        self._lotes = iter(lotes)
+        self._indices_binarios = indices_binarios or []
+        self._buffer = io.StringIO()
+        self._escritor = csv.writer(self._buffer, quoting=csv.QUOTE_NOTNULL, lineterminator="\n")
+        self._pendente = ""
+        self.total_registros = 0
+    
+    def _codificar(self, lote: List[tuple]) -> str:
+        if self._indices_binarios:
+            lote = converter_binarios(lote, self._indices_binarios)
+        
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._escritor.writerows(lote)
+        self.total_registros += len(lote)
+        return self._buffer.getvalue()
+    
+    def read(self, tamanho: int = -1) -> str:
+        partes = [self._pendente]
+        acumulado = len(self._pendente)
+        
+        while tamanho < 0 or acumulado < tamanho:
+            lote = next(self._lotes, None)
+            if lote is None:
+                break
+            dados_lote = self._codificar(lote)
+            partes.append(dados_lote)
+            acumulado += len(dados_lote)
+        
+        dados = "".join(partes)
+        if tamanho < 0:
+            self._pendente = ""
+            return dados
+        
+        self._pendente = dados[tamanho:]
+        return dados[:tamanho]
 
 # ============================================================
 # TAREFAS ETL
@@ -130,44 +350,188 @@ def inicializar_dimensao_tempo(**context):
                 logger.info(f"Dimensão tempo já contém {total} registros. Pulando...")
                 return
             
-            # Insere calendário completo
+            # Insere calendário completo (nomes pré-calculados, sem TO_CHAR por linha)
             cursor.execute("""
+                WITH nomes_dia(dow, nome) AS (
+                    VALUES (0, 'Sunday'), (1, 'Monday'), (2, 'Tuesday'), (3, 'Wednesday'),
+                           (4, 'Thursday'), (5, 'Friday'), (6, 'Saturday')
+                ),
+                nomes_mes(mes, nome) AS (
+                    VALUES (1, 'January'), (2, 'February'), (3, 'March'), (4, 'April'),
+                           (5, 'May'), (6, 'June'), (7, 'July'), (8, 'August'),
+                           (9, 'September'), (10, 'October'), (11, 'November'), (12, 'December')
+                ),
+                calendario AS (
+                    SELECT
+                        gs.d::DATE AS d,
+                        EXTRACT(YEAR FROM gs.d)::INT AS ano,
+                        EXTRACT(MONTH FROM gs.d)::INT AS mes,
+                        EXTRACT(DAY FROM gs.d)::INT AS dia,
+                        EXTRACT(DOW FROM gs.d)::INT AS dow,
+                        EXTRACT(ISODOW FROM gs.d)::INT AS isodow
+                    FROM generate_series(
+                        '2008-01-01'::DATE, 
+                        '2030-12-31'::DATE, 
+                        INTERVAL '1 day'
+                    ) AS gs(d)
+                )
                 INSERT INTO dw.dim_tempo (
                     sk_tempo, data_completa, ano, trimestre, mes, dia,
-                    semana_ano, dia_semana, nome_mes, nome_dia_semana,
+                    semana_ano, dia_semana, numero_dia_semana, nome_mes, nome_dia_semana,
                     eh_fim_semana, eh_feriado
                 )
                 SELECT 
-                    TO_CHAR(d, 'YYYYMMDD')::INT AS sk_tempo,
-                    d::DATE AS data_completa,
-                    EXTRACT(YEAR FROM d)::SMALLINT AS ano,
-                    EXTRACT(QUARTER FROM d)::SMALLINT AS trimestre,
-                    EXTRACT(MONTH FROM d)::SMALLINT AS mes,
-                    EXTRACT(DAY FROM d)::SMALLINT AS dia,
-                    EXTRACT(WEEK FROM d)::SMALLINT AS semana_ano,
-                    EXTRACT(DOW FROM d)::SMALLINT AS dia_semana,
-                    TO_CHAR(d, 'TMMonth') AS nome_mes,
-                    TO_CHAR(d, 'TMDay') AS nome_dia_semana,
-                    CASE WHEN EXTRACT(DOW FROM d) IN (0, 6) THEN TRUE ELSE FALSE END AS eh_fim_semana,
+                    c.ano * 10000 + c.mes * 100 + c.dia AS sk_tempo,
+                    c.d AS data_completa,
+                    c.ano::SMALLINT AS ano,
+                    ((c.mes + 2) / 3)::SMALLINT AS trimestre,
+                    c.mes::SMALLINT AS mes,
+                    c.dia::SMALLINT AS dia,
+                    EXTRACT(WEEK FROM c.d)::SMALLINT AS semana_ano,
+                    c.dow::SMALLINT AS dia_semana,
+                    c.isodow::SMALLINT AS numero_dia_semana,
+                    nm.nome AS nome_mes,
+                    nd.nome AS nome_dia_semana,
+                    c.isodow >= 6 AS eh_fim_semana,
                     FALSE AS eh_feriado
-                FROM generate_series(
-                    '2008-01-01'::DATE, 
-                    '2030-12-31'::DATE, 
-                    INTERVAL '1 day'
-                ) AS gs(d)
+                FROM calendario c
+                JOIN nomes_dia nd ON nd.dow = c.dow
+                JOIN nomes_mes nm ON nm.mes = c.mes
             """)
             
+            total_inserido = cursor.rowcount
             conn.commit()
             
-            cursor.execute("SELECT COUNT(*) FROM dw.dim_tempo")
-            total_inserido = cursor.fetchone()[0]
             logger.info(f"Dimensão tempo carregada com {total_inserido} registros")
 
 
+def carregar_tabela_staging(cursor_mssql, cursor_pg, tabela_origem: str, tabela_staging: str,
+                            watermark: int = None) -> int:
+    """
+    Extrai uma tabela do SQL Server e a recria em staging via COPY
+    Tabelas incrementais trazem apenas as linhas acima do watermark
+    """
+    logger.info(f"Processando {tabela_origem} -> staging.{tabela_staging}")
+    
+    # Extrai dados em fluxo (sem fetchall)
+    if tabela_origem in TABELAS_INCREMENTAIS:
+        coluna = TABELAS_INCREMENTAIS[tabela_origem]
+        logger.info(f"{tabela_origem}: extraindo {coluna} > {watermark or 0}")
+        cursor_mssql.execute(
+            f"SELECT * FROM {tabela_origem} WHERE [{coluna}] > %s",
+            (watermark or 0,)
+        )
+    else:
+        cursor_mssql.execute(f"SELECT * FROM {tabela_origem}")
+    amostra = cursor_mssql.fetchmany(TAMANHO_AMOSTRA_TIPOS)
+    
+    # Tipos a partir do cursor.description (amostra só para NUMBER)
+    tipos_coluna = mapear_tipos_colunas(cursor_mssql.description, amostra)
+    
+    # Identificadores compostos uma vez por tabela (aspas e escape pelo psycopg2)
+    tabela = sql.Identifier("staging", tabela_staging)
+    definicao_colunas = sql.SQL(", ").join(
+        sql.SQL("{} {}").format(sql.Identifier(col), sql.SQL(tipo))
+        for col, tipo in tipos_coluna.items()
+    )
+    
+    # Esquema inalterado: TRUNCATE preserva tabela, índice e planos das cargas seguintes
+    # Hash do cursor.description (nome, type_code, precisão, escala): os tipos inferidos da
+    # amostra variam com os deltas incrementais (ex.: colunas só com NULL viram DOUBLE PRECISION)
+    hash_esquema = hashlib.md5(
+        repr([tuple(desc) for desc in cursor_mssql.description]).encode("utf-8")
+    ).hexdigest()
+    cursor_pg.execute("""
+        SELECT hash_esquema FROM staging.controle_esquema
+        WHERE tabela = %s AND to_regclass(%s) IS NOT NULL
+    """, (tabela_staging, f"staging.{tabela_staging}"))
+    registro_hash = cursor_pg.fetchone()
+    recriar = registro_hash is None or registro_hash[0] != hash_esquema
+    
+    if recriar:
+        # Conexão em autocommit: o hash antigo sai antes do DROP e o novo só é gravado
+        # após COPY e índice, então uma falha no meio força nova recriação no retry
+        cursor_pg.execute(
+            "DELETE FROM staging.controle_esquema WHERE tabela = %s", (tabela_staging,)
+        )
+        cursor_pg.execute(sql.SQL("DROP TABLE IF EXISTS {} CASCADE").format(tabela))
+        # UNLOGGED: staging é descartável e dispensa WAL
+        cursor_pg.execute(
+            sql.SQL("CREATE UNLOGGED TABLE {} ({})").format(tabela, definicao_colunas)
+        )
+    else:
+        cursor_pg.execute(sql.SQL("TRUNCATE {}").format(tabela))
+    
+    total_registros = 0
+    if amostra:
+        # Carrega via COPY CSV: amostra primeiro, depois o restante em lotes
+        indices_binarios = [
+            idx for idx, desc in enumerate(cursor_mssql.description)
+            if desc[1] == CODIGO_MSSQL_BINARY
+        ]
+        fluxo = FluxoCopy(chain([amostra], iterar_lotes(cursor_mssql)), indices_binarios)
+        cursor_pg.copy_expert(
+            sql.SQL("COPY {} FROM STDIN WITH (FORMAT CSV)").format(tabela),
+            fluxo
+        )
+        total_registros = fluxo.total_registros
+    else:
+        logger.warning(f"Tabela {tabela_origem} está vazia")
+    
+    # Tabela nova: índice criado depois do COPY (mais barato que manter durante a carga)
+    coluna_chave = CHAVES_STAGING.get(tabela_staging)
+    if recriar and coluna_chave:
+        cursor_pg.execute(
+            sql.SQL("CREATE UNIQUE INDEX ON {} ({})").format(tabela, sql.Identifier(coluna_chave))
+        )
+    
+    if recriar:
+        cursor_pg.execute("""
+            INSERT INTO staging.controle_esquema (tabela, hash_esquema)
+            VALUES (%s, %s)
+            ON CONFLICT (tabela) DO UPDATE SET hash_esquema = EXCLUDED.hash_esquema
+        """, (tabela_staging, hash_esquema))
+    
+    logger.info(
+        f"Tabela {tabela_staging}: {total_registros} registros carregados "
+        f"({'recriada' if recriar else 'truncada'})"
+    )
+    return total_registros
+
+
+def processar_fila_staging(fila: Queue, watermarks: Dict[str, int]) -> None:
+    """
+    Worker da extração: consome tabelas da fila até esvaziá-la
+    Cada worker possui seu próprio par de conexões (os drivers não são thread-safe)
+    """
+    with obter_conexao_destino() as conn_destino:
+        conn_destino.autocommit = True
+        
+        with conn_destino.cursor() as cursor_pg, \
+                obter_conexao_fonte() as conn_fonte, \
+                conn_fonte.cursor() as cursor_mssql:
+            # Um único cursor reaproveitado para todas as tabelas do worker
+            cursor_mssql.arraysize = TAMANHO_LOTE_EXTRACAO
+            
+            # Staging é recriada a cada execução: não precisa aguardar fsync no commit
+            cursor_pg.execute("SET synchronous_commit = OFF")
+            
+            while True:
+                try:
+                    tabela_origem, tabela_staging = fila.get_nowait()
+                except Empty:
+                    return
+                
+                carregar_tabela_staging(
+                    cursor_mssql, cursor_pg, tabela_origem, tabela_staging,
+                    watermarks.get(tabela_origem)
+                )
+
+
 def extrair_dados_para_staging(**context):
     """
     Extrai dados do SQL Server e carrega em tabelas staging no PostgreSQL
-    Usa inferência automática de tipos e carregamento em batch
+    Usa inferência automática de tipos, carga via COPY e tabelas em paralelo
     """
     logger.info("Iniciando extração de dados para staging")
     
@@ -178,256 +542,341 @@ def extrair_dados_para_staging(**context):
             # Cria schema de staging
             cursor_pg.execute("CREATE SCHEMA IF NOT EXISTS staging")
             
-            with obter_conexao_fonte() as conn_fonte:
-                for tabela_origem, tabela_staging in MAPA_TABELAS.items():
-                    logger.info(f"Processando {tabela_origem} -> staging.{tabela_staging}")
-                    
-                    # Extrai dados
-                    with conn_fonte.cursor() as cursor_mssql:
-                        cursor_mssql.execute(f"SELECT * FROM {tabela_origem}")
-                        registros = cursor_mssql.fetchall()
-                        colunas = [desc[0] for desc in cursor_mssql.description]
-                    
-                    # Recria tabela staging
-                    cursor_pg.execute(f"DROP TABLE IF EXISTS staging.{tabela_staging} CASCADE")
-                    
-                    if not registros:
-                        cursor_pg.execute(f"CREATE TABLE staging.{tabela_staging} (placeholder INT)")
-                        logger.warning(f"Tabela {tabela_origem} está vazia")
-                        continue
-                    
-                    # Inferência de tipos
-                    amostra = registros[:min(len(registros), 1000)]
-                    tipos_coluna = {}
-                    
-                    for idx, coluna in enumerate(colunas):
-                        valores_amostra = [r[idx] for r in amostra if r[idx] is not None]
-                        tipos_coluna[coluna] = inferir_tipo_coluna(valores_amostra)
-                    
-                    # Cria tabela staging
-                    definicao_colunas = ", ".join([
-                        f'"{col}" {tipos_coluna[col]}' for col in colunas
-                    ])
-                    cursor_pg.execute(
-                        f"CREATE TABLE staging.{tabela_staging} ({definicao_colunas})"
-                    )
-                    
-                    # Insere dados em lotes
-                    tamanho_lote = 500
-                    total_inserido = 0
-                    
-                    for i in range(0, len(registros), tamanho_lote):
-                        lote = registros[i:i + tamanho_lote]
-                        placeholders = ", ".join(["%s"] * len(colunas))
-                        
-                        execute_batch(
-                            cursor_pg,
-                            f"INSERT INTO staging.{tabela_staging} VALUES ({placeholders})",
-                            lote,
-                            page_size=tamanho_lote
-                        )
-                        total_inserido += len(lote)
-                    
-                    logger.info(f"Tabela {tabela_staging}: {total_inserido} registros carregados")
-    
-    logger.info("Extração para staging concluída com sucesso")
-
-
-def carregar_dimensao_cliente(**context):
-    """Carga da dimensão cliente com SCD Type 1"""
-    logger.info("Carregando dimensão cliente")
-    
-    with obter_conexao_destino() as conn:
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                INSERT INTO dw.dim_cliente (
-                    nk_cliente, nome_cliente, sobrenome, nome_completo,
-                    tipo_cliente, segmento, data_cadastro
+            # Hash do esquema de cada tabela staging (decide entre TRUNCATE e DROP+CREATE)
+            cursor_pg.execute("""
+                CREATE TABLE IF NOT EXISTS staging.controle_esquema (
+                    tabela        TEXT PRIMARY KEY,
+                    hash_esquema  TEXT NOT NULL
                 )
-                SELECT DISTINCT
-                    c."CustomerID"::INT AS nk_cliente,
-                    COALESCE(p."FirstName", 'Desconhecido') AS nome_cliente,
-                    COALESCE(p."LastName", '') AS sobrenome,
-                    COALESCE(p."FirstName" || ' ' || p."LastName", 'Cliente ' || c."CustomerID"::TEXT) AS nome_completo,
-                    CASE 
-                        WHEN c."PersonID" IS NOT NULL THEN 'Pessoa Física'
-                        WHEN c."StoreID" IS NOT NULL THEN 'Empresa'
-                        ELSE 'Indefinido'
-                    END AS tipo_cliente,
-                    'Varejo' AS segmento,
-                    CURRENT_DATE AS data_cadastro
-                FROM staging.stage_clientes c
-                LEFT JOIN staging.stage_pessoas p ON p."BusinessEntityID"::INT = c."PersonID"::INT
-                WHERE c."CustomerID" IS NOT NULL
-                ON CONFLICT (nk_cliente) DO UPDATE SET
-                    nome_cliente = EXCLUDED.nome_cliente,
-                    sobrenome = EXCLUDED.sobrenome,
-                    nome_completo = EXCLUDED.nome_completo,
-                    tipo_cliente = EXCLUDED.tipo_cliente,
-                    ultima_atualizacao = CURRENT_TIMESTAMP
             """)
             
-            conn.commit()
-            logger.info(f"Dimensão cliente atualizada: {cursor.rowcount} registros")
-
-
-def carregar_dimensao_produto(**context):
-    """Carga da dimensão produto com hierarquia completa"""
-    logger.info("Carregando dimensão produto")
-    
-    with obter_conexao_destino() as conn:
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                INSERT INTO dw.dim_produto (
-                    nk_produto, nome_produto, codigo_produto,
-                    categoria_produto, subcategoria_produto, linha_produto,
-                    cor_produto, tamanho, peso,
-                    custo_unitario, preco_lista, margem_percentual,
-                    data_inicio_vigencia, status_ativo
+            # Controle de carga incremental (também em create_dw_schema.sql)
+            cursor_pg.execute("CREATE SCHEMA IF NOT EXISTS control")
+            cursor_pg.execute("""
+                CREATE TABLE IF NOT EXISTS control.etl_watermark (
+                    tabela      TEXT PRIMARY KEY,
+                    high_water  BIGINT NOT NULL
                 )
-                SELECT DISTINCT
-                    p."ProductID"::INT AS nk_produto,
-                    p."Name" AS nome_produto,
-                    p."ProductNumber" AS codigo_produto,
-                    COALESCE(pc."Name", 'Sem Categoria') AS categoria_produto,
-                    COALESCE(psc."Name", 'Sem Subcategoria') AS subcategoria_produto,
-                    COALESCE(p."ProductLine", 'N/A') AS linha_produto,
-                    COALESCE(p."Color", 'N/A') AS cor_produto,
-                    COALESCE(p."Size", 'N/A') AS tamanho,
-                    COALESCE(p."Weight", 0)::NUMERIC(10,2) AS peso,
-                    COALESCE(p."StandardCost", 0)::NUMERIC(15,4) AS custo_unitario,
-                    COALESCE(p."ListPrice", 0)::NUMERIC(15,4) AS preco_lista,
-                    CASE 
-                        WHEN COALESCE(p."ListPrice", 0) > 0 
-                        THEN ((COALESCE(p."ListPrice", 0) - COALESCE(p."StandardCost", 0)) / COALESCE(p."ListPrice", 1) * 100)::NUMERIC(5,2)
-                        ELSE 0
-                    END AS margem_percentual,
-                    COALESCE(p."SellStartDate"::DATE, CURRENT_DATE) AS data_inicio_vigencia,
-                    CASE WHEN p."SellEndDate" IS NULL THEN TRUE ELSE FALSE END AS status_ativo
-                FROM staging.stage_produtos p
-                LEFT JOIN staging.stage_subcategorias psc 
-                    ON psc."ProductSubcategoryID"::INT = p."ProductSubcategoryID"::INT
-                LEFT JOIN staging.stage_categorias pc 
-                    ON pc."ProductCategoryID"::INT = psc."ProductCategoryID"::INT
-                WHERE p."ProductID" IS NOT NULL
-                ON CONFLICT (nk_produto) DO UPDATE SET
-                    nome_produto = EXCLUDED.nome_produto,
-                    categoria_produto = EXCLUDED.categoria_produto,
-                    subcategoria_produto = EXCLUDED.subcategoria_produto,
-                    cor_produto = EXCLUDED.cor_produto,
-                    custo_unitario = EXCLUDED.custo_unitario,
-                    preco_lista = EXCLUDED.preco_lista,
-                    margem_percentual = EXCLUDED.margem_percentual,
-                    status_ativo = EXCLUDED.status_ativo
             """)
+            cursor_pg.execute(
+                "SELECT tabela, high_water FROM control.etl_watermark WHERE tabela = ANY(%s)",
+                (list(TABELAS_INCREMENTAIS),)
+            )
+            watermarks = dict(cursor_pg.fetchall())
             
-            conn.commit()
-            logger.info(f"Dimensão produto atualizada: {cursor.rowcount} registros")
+            # Sem registro de controle (ex.: DW carregado antes do watermark existir):
+            # parte do maior pedido já presente na fato, coberto por idx_fato_vendas_pedido
+            if len(watermarks) < len(TABELAS_INCREMENTAIS):
+                cursor_pg.execute("""
+                    INSERT INTO control.etl_watermark (tabela, high_water)
+                    SELECT t.tabela, f.maior_pedido
+                    FROM UNNEST(%s::TEXT[]) AS t(tabela)
+                    CROSS JOIN (SELECT MAX(numero_pedido) AS maior_pedido FROM dw.fato_vendas) f
+                    WHERE f.maior_pedido IS NOT NULL
+                    ON CONFLICT (tabela) DO NOTHING
+                    RETURNING tabela, high_water
+                """, (list(TABELAS_INCREMENTAIS),))
+                watermarks.update(cursor_pg.fetchall())
+    
+    # Tabelas independentes: workers consomem a mesma fila
+    fila = Queue()
+    for item in MAPA_TABELAS.items():
+        fila.put(item)
+    
+    total_workers = min(MAX_WORKERS_STAGING, len(MAPA_TABELAS))
+    with ThreadPoolExecutor(max_workers=total_workers) as executor:
+        futuros = [executor.submit(processar_fila_staging, fila, watermarks) for _ in range(total_workers)]
+        
+        # Propaga a primeira falha de qualquer worker
+        for futuro in futuros:
+            futuro.result()
+    
+    logger.info("Extração para staging concluída com sucesso")
 
 
-def carregar_dimensao_regiao(**context):
-    """Carga da dimensão região geográfica"""
-    logger.info("Carregando dimensão região")
-    
-    with obter_conexao_destino() as conn:
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                INSERT INTO dw.dim_regiao (
-                    nk_regiao, nome_territorio, codigo_pais,
-                    nome_pais, continente, grupo_regional
-                )
-                SELECT DISTINCT
-                    t."TerritoryID"::INT AS nk_regiao,
-                    t."Name" AS nome_territorio,
-                    t."CountryRegionCode" AS codigo_pais,
-                    t."CountryRegionCode" AS nome_pais,
-                    CASE 
-                        WHEN t."Group" LIKE '%America%' THEN 'Américas'
-                        WHEN t."Group" LIKE '%Europe%' THEN 'Europa'
-                        WHEN t."Group" LIKE '%Pacific%' THEN 'Ásia-Pacífico'
-                        ELSE 'Outros'
-                    END AS continente,
-                    t."Group" AS grupo_regional
-                FROM staging.stage_territorios t
-                WHERE t."TerritoryID" IS NOT NULL
-                ON CONFLICT (nk_regiao) DO UPDATE SET
-                    nome_territorio = EXCLUDED.nome_territorio,
-                    grupo_regional = EXCLUDED.grupo_regional
-            """)
-            
-            conn.commit()
-            logger.info(f"Dimensão região atualizada: {cursor.rowcount} registros")
+# Carga da dimensão cliente com SCD Type 1
+SQL_DIMENSAO_CLIENTE = """
+        WITH origem AS (
+            SELECT
+                c."CustomerID"::INT AS nk_cliente,
+                COALESCE(p."FirstName", 'Desconhecido') AS nome_cliente,
+                COALESCE(p."LastName", '') AS sobrenome,
+                COALESCE(p."FirstName" || ' ' || p."LastName", 'Cliente ' || c."CustomerID"::TEXT) AS nome_completo,
+                CASE 
+                    WHEN c."PersonID" IS NOT NULL THEN 'Pessoa Física'
+                    WHEN c."StoreID" IS NOT NULL THEN 'Empresa'
+                    ELSE 'Indefinido'
+                END AS tipo_cliente,
+                'Varejo' AS segmento,
+                CURRENT_DATE AS data_cadastro
+            FROM staging.stage_clientes c
+            LEFT JOIN staging.stage_pessoas p ON p."BusinessEntityID"::INT = c."PersonID"::INT
+            WHERE c."CustomerID" IS NOT NULL
+        ),
+        delta AS (
+            -- Apenas clientes novos ou com atributos alterados
+            SELECT o.*
+            FROM origem o
+            LEFT JOIN dw.dim_cliente d ON d.nk_cliente = o.nk_cliente
+            WHERE d.nk_cliente IS NULL
+               OR (d.nome_cliente, d.sobrenome, d.nome_completo, d.tipo_cliente)
+                  IS DISTINCT FROM (o.nome_cliente, o.sobrenome, o.nome_completo, o.tipo_cliente)
+        )
+        INSERT INTO dw.dim_cliente (
+            nk_cliente, nome_cliente, sobrenome, nome_completo,
+            tipo_cliente, segmento, data_cadastro
+        )
+        SELECT
+            nk_cliente, nome_cliente, sobrenome, nome_completo,
+            tipo_cliente, segmento, data_cadastro
+        FROM delta
+        ON CONFLICT (nk_cliente) DO UPDATE SET
+            nome_cliente = EXCLUDED.nome_cliente,
+            sobrenome = EXCLUDED.sobrenome,
+            nome_completo = EXCLUDED.nome_completo,
+            tipo_cliente = EXCLUDED.tipo_cliente,
+            ultima_atualizacao = CURRENT_TIMESTAMP
+"""
+
+
+# Carga da dimensão produto com hierarquia completa
+SQL_DIMENSAO_PRODUTO = """
+        WITH origem AS (
+            SELECT
+                p."ProductID"::INT AS nk_produto,
+                p."Name" AS nome_produto,
+                p."ProductNumber" AS codigo_produto,
+                COALESCE(pc."Name", 'Sem Categoria') AS categoria_produto,
+                COALESCE(psc."Name", 'Sem Subcategoria') AS subcategoria_produto,
+                COALESCE(p."ProductLine", 'N/A') AS linha_produto,
+                COALESCE(p."Color", 'N/A') AS cor_produto,
+                COALESCE(p."Size", 'N/A') AS tamanho,
+                COALESCE(p."Weight", 0)::NUMERIC(10,2) AS peso,
+                COALESCE(p."StandardCost", 0)::NUMERIC(15,4) AS custo_unitario,
+                COALESCE(p."ListPrice", 0)::NUMERIC(15,4) AS preco_lista,
+                CASE 
+                    WHEN COALESCE(p."ListPrice", 0) > 0 
+                    THEN ((COALESCE(p."ListPrice", 0) - COALESCE(p."StandardCost", 0)) / COALESCE(p."ListPrice", 1) * 100)::NUMERIC(5,2)
+                    ELSE 0
+                END AS margem_percentual,
+                COALESCE(p."SellStartDate"::DATE, CURRENT_DATE) AS data_inicio_vigencia,
+                CASE WHEN p."SellEndDate" IS NULL THEN TRUE ELSE FALSE END AS status_ativo
+            FROM staging.stage_produtos p
+            LEFT JOIN staging.stage_subcategorias psc 
+                ON psc."ProductSubcategoryID"::INT = p."ProductSubcategoryID"::INT
+            LEFT JOIN staging.stage_categorias pc 
+                ON pc."ProductCategoryID"::INT = psc."ProductCategoryID"::INT
+            WHERE p."ProductID" IS NOT NULL
+        ),
+        delta AS (
+            -- Apenas produtos novos ou com atributos alterados
+            SELECT o.*
+            FROM origem o
+            LEFT JOIN dw.dim_produto d ON d.nk_produto = o.nk_produto
+            WHERE d.nk_produto IS NULL
+               OR (d.nome_produto, d.categoria_produto, d.subcategoria_produto, d.cor_produto,
+                   d.custo_unitario, d.preco_lista, d.margem_percentual, d.status_ativo)
+                  IS DISTINCT FROM
+                  (o.nome_produto, o.categoria_produto, o.subcategoria_produto, o.cor_produto,
+                   o.custo_unitario, o.preco_lista, o.margem_percentual, o.status_ativo)
+        )
+        INSERT INTO dw.dim_produto (
+            nk_produto, nome_produto, codigo_produto,
+            categoria_produto, subcategoria_produto, linha_produto,
+            cor_produto, tamanho, peso,
+            custo_unitario, preco_lista, margem_percentual,
+            data_inicio_vigencia, status_ativo
+        )
+        SELECT
+            nk_produto, nome_produto, codigo_produto,
+            categoria_produto, subcategoria_produto, linha_produto,
+            cor_produto, tamanho, peso,
+            custo_unitario, preco_lista, margem_percentual,
+            data_inicio_vigencia, status_ativo
+        FROM delta
+        ON CONFLICT (nk_produto) DO UPDATE SET
+            nome_produto = EXCLUDED.nome_produto,
+            categoria_produto = EXCLUDED.categoria_produto,
+            subcategoria_produto = EXCLUDED.subcategoria_produto,
+            cor_produto = EXCLUDED.cor_produto,
+            custo_unitario = EXCLUDED.custo_unitario,
+            preco_lista = EXCLUDED.preco_lista,
+            margem_percentual = EXCLUDED.margem_percentual,
+            status_ativo = EXCLUDED.status_ativo
+"""
+
+
+# Carga da dimensão região geográfica
+SQL_DIMENSAO_REGIAO = """
+        WITH origem AS (
+            SELECT
+                t."TerritoryID"::INT AS nk_regiao,
+                t."Name" AS nome_territorio,
+                t."CountryRegionCode" AS codigo_pais,
+                t."CountryRegionCode" AS nome_pais,
+                CASE 
+                    WHEN t."Group" LIKE '%America%' THEN 'Américas'
+                    WHEN t."Group" LIKE '%Europe%' THEN 'Europa'
+                    WHEN t."Group" LIKE '%Pacific%' THEN 'Ásia-Pacífico'
+                    ELSE 'Outros'
+                END AS continente,
+                t."Group" AS grupo_regional
+            FROM staging.stage_territorios t
+            WHERE t."TerritoryID" IS NOT NULL
+        ),
+        delta AS (
+            -- Apenas regiões novas ou com atributos alterados
+            SELECT o.*
+            FROM origem o
+            LEFT JOIN dw.dim_regiao d ON d.nk_regiao = o.nk_regiao
+            WHERE d.nk_regiao IS NULL
+               OR (d.nome_territorio, d.grupo_regional)
+                  IS DISTINCT FROM (o.nome_territorio, o.grupo_regional)
+        )
+        INSERT INTO dw.dim_regiao (
+            nk_regiao, nome_territorio, codigo_pais,
+            nome_pais, continente, grupo_regional
+        )
+        SELECT
+            nk_regiao, nome_territorio, codigo_pais,
+            nome_pais, continente, grupo_regional
+        FROM delta
+        ON CONFLICT (nk_regiao) DO UPDATE SET
+            nome_territorio = EXCLUDED.nome_territorio,
+            grupo_regional = EXCLUDED.grupo_regional
+"""
+
+
+# Carga da dimensão vendedor (depende da dim_regiao)
+SQL_DIMENSAO_VENDEDOR = """
+        WITH origem AS (
+            SELECT
+                sp."BusinessEntityID"::INT AS nk_vendedor,
+                COALESCE(p."FirstName" || ' ' || p."LastName", 'Vendedor ' || sp."BusinessEntityID"::TEXT) AS nome_vendedor,
+                'V' || LPAD(sp."BusinessEntityID"::TEXT, 5, '0') AS codigo_vendedor,
+                dr.sk_regiao,
+                e."HireDate"::DATE AS data_admissao,
+                COALESCE(sp."SalesQuota", 0)::NUMERIC(18,2) AS meta_anual,
+                COALESCE(sp."CommissionPct", 0)::NUMERIC(5,2) AS comissao_percentual
+            FROM staging.stage_vendedores sp
+            LEFT JOIN staging.stage_funcionarios e 
+                ON e."BusinessEntityID"::INT = sp."BusinessEntityID"::INT
+            LEFT JOIN staging.stage_pessoas p 
+                ON p."BusinessEntityID"::INT = sp."BusinessEntityID"::INT
+            LEFT JOIN dw.dim_regiao dr 
+                ON dr.nk_regiao = sp."TerritoryID"::INT
+            WHERE sp."BusinessEntityID" IS NOT NULL
+        ),
+        delta AS (
+            -- Apenas vendedores novos ou com atributos alterados
+            SELECT o.*
+            FROM origem o
+            LEFT JOIN dw.dim_vendedor d ON d.nk_vendedor = o.nk_vendedor
+            WHERE d.nk_vendedor IS NULL
+               OR (d.nome_vendedor, d.sk_regiao, d.meta_anual, d.comissao_percentual)
+                  IS DISTINCT FROM (o.nome_vendedor, o.sk_regiao, o.meta_anual, o.comissao_percentual)
+        )
+        INSERT INTO dw.dim_vendedor (
+            nk_vendedor, nome_vendedor, codigo_vendedor,
+            sk_regiao, data_admissao, meta_anual, comissao_percentual
+        )
+        SELECT
+            nk_vendedor, nome_vendedor, codigo_vendedor,
+            sk_regiao, data_admissao, meta_anual, comissao_percentual
+        FROM delta
+        ON CONFLICT (nk_vendedor) DO UPDATE SET
+            nome_vendedor = EXCLUDED.nome_vendedor,
+            sk_regiao = EXCLUDED.sk_regiao,
+            meta_anual = EXCLUDED.meta_anual,
+            comissao_percentual = EXCLUDED.comissao_percentual
+"""
 
 
 def carregar_dimensao_vendedor(**context):
     """Carga da dimensão vendedor"""
-    logger.info("Carregando dimensão vendedor")
+    executar_carga_dimensao("vendedor", SQL_DIMENSAO_VENDEDOR)
+
+
+# Carga da dimensão oferta especial
+SQL_DIMENSAO_OFERTA = """
+        WITH origem AS (
+            SELECT
+                o."SpecialOfferID"::INT AS nk_oferta,
+                o."Description" AS descricao_oferta,
+                o."Type" AS tipo_oferta,
+                COALESCE(o."DiscountPct", 0)::NUMERIC(5,2) AS percentual_desconto,
+                o."StartDate"::DATE AS data_inicio,
+                o."EndDate"::DATE AS data_fim,
+                COALESCE(o."MinQty", 0) AS quantidade_minima,
+                COALESCE(o."MaxQty", 999999) AS quantidade_maxima
+            FROM staging.stage_ofertas o
+            WHERE o."SpecialOfferID" IS NOT NULL
+        ),
+        delta AS (
+            -- Apenas ofertas novas ou com atributos alterados
+            SELECT o.*
+            FROM origem o
+            LEFT JOIN dw.dim_oferta d ON d.nk_oferta = o.nk_oferta
+            WHERE d.nk_oferta IS NULL
+               OR (d.descricao_oferta, d.percentual_desconto, d.data_fim)
+                  IS DISTINCT FROM (o.descricao_oferta, o.percentual_desconto, o.data_fim)
+        )
+        INSERT INTO dw.dim_oferta (
+            nk_oferta, descricao_oferta, tipo_oferta,
+            percentual_desconto, data_inicio, data_fim,
+            quantidade_minima, quantidade_maxima
+        )
+        SELECT
+            nk_oferta, descricao_oferta, tipo_oferta,
+            percentual_desconto, data_inicio, data_fim,
+            quantidade_minima, quantidade_maxima
+        FROM delta
+        ON CONFLICT (nk_oferta) DO UPDATE SET
+            descricao_oferta = EXCLUDED.descricao_oferta,
+            percentual_desconto = EXCLUDED.percentual_desconto,
+            data_fim = EXCLUDED.data_fim
+"""
+
+
+# Dimensões que dependem apenas da staging, na ordem de execução
+DIMENSOES_INDEPENDENTES = [
+    ("cliente", SQL_DIMENSAO_CLIENTE),
+    ("produto", SQL_DIMENSAO_PRODUTO),
+    ("região", SQL_DIMENSAO_REGIAO),
+    ("oferta", SQL_DIMENSAO_OFERTA),
+]
+
+
+def carregar_todas_dimensoes(**context):
+    """
+    Carga das dimensões cliente, produto, região e oferta com SCD Type 1
+    Uma conexão e uma única transação: um commit no lugar de quatro
+    """
+    logger.info(f"Carregando {len(DIMENSOES_INDEPENDENTES)} dimensões em uma transação")
     
     with obter_conexao_destino() as conn:
         with conn.cursor() as cursor:
-            cursor.execute("""
-                INSERT INTO dw.dim_vendedor (
-                    nk_vendedor, nome_vendedor, codigo_vendedor,
-                    sk_regiao, data_admissao, meta_anual, comissao_percentual
-                )
-                SELECT DISTINCT
-                    sp."BusinessEntityID"::INT AS nk_vendedor,
-                    COALESCE(p."FirstName" || ' ' || p."LastName", 'Vendedor ' || sp."BusinessEntityID"::TEXT) AS nome_vendedor,
-                    'V' || LPAD(sp."BusinessEntityID"::TEXT, 5, '0') AS codigo_vendedor,
-                    dr.sk_regiao,
-                    e."HireDate"::DATE AS data_admissao,
-                    COALESCE(sp."SalesQuota", 0)::NUMERIC(18,2) AS meta_anual,
-                    COALESCE(sp."CommissionPct", 0)::NUMERIC(5,2) AS comissao_percentual
-                FROM staging.stage_vendedores sp
-                LEFT JOIN staging.stage_funcionarios e 
-                    ON e."BusinessEntityID"::INT = sp."BusinessEntityID"::INT
-                LEFT JOIN staging.stage_pessoas p 
-                    ON p."BusinessEntityID"::INT = sp."BusinessEntityID"::INT
-                LEFT JOIN dw.dim_regiao dr 
-                    ON dr.nk_regiao = sp."TerritoryID"::INT
-                WHERE sp."BusinessEntityID" IS NOT NULL
-                ON CONFLICT (nk_vendedor) DO UPDATE SET
-                    nome_vendedor = EXCLUDED.nome_vendedor,
-                    sk_regiao = EXCLUDED.sk_regiao,
-                    meta_anual = EXCLUDED.meta_anual,
-                    comissao_percentual = EXCLUDED.comissao_percentual
-            """)
-            
-            conn.commit()
-            logger.info(f"Dimensão vendedor atualizada: {cursor.rowcount} registros")
+            for nome_dimensao, comando_sql in DIMENSOES_INDEPENDENTES:
+                cursor.execute(comando_sql)
+                logger.info(f"Dimensão {nome_dimensao} atualizada: {cursor.rowcount} registros novos ou alterados")
+        
+        conn.commit()
 
 
-def carregar_dimensao_oferta(**context):
-    """Carga da dimensão oferta especial"""
-    logger.info("Carregando dimensão oferta")
+def otimizar_estatisticas(**context):
+    """
+    Atualiza as estatísticas do planner antes da carga da fato
+    As tabelas staging acabaram de ser recriadas e ainda não possuem estatísticas
+    """
+    logger.info("Atualizando estatísticas das tabelas usadas na carga da fato")
     
     with obter_conexao_destino() as conn:
+        conn.autocommit = True
+        
         with conn.cursor() as cursor:
-            cursor.execute("""
-                INSERT INTO dw.dim_oferta (
-                    nk_oferta, descricao_oferta, tipo_oferta,
-                    percentual_desconto, data_inicio, data_fim,
-                    quantidade_minima, quantidade_maxima
-                )
-                SELECT DISTINCT
-                    o."SpecialOfferID"::INT AS nk_oferta,
-                    o."Description" AS descricao_oferta,
-                    o."Type" AS tipo_oferta,
-                    COALESCE(o."DiscountPct", 0)::NUMERIC(5,2) AS percentual_desconto,
-                    o."StartDate"::DATE AS data_inicio,
-                    o."EndDate"::DATE AS data_fim,
-                    COALESCE(o."MinQty", 0) AS quantidade_minima,
-                    COALESCE(o."MaxQty", 999999) AS quantidade_maxima
-                FROM staging.stage_ofertas o
-                WHERE o."SpecialOfferID" IS NOT NULL
-                ON CONFLICT (nk_oferta) DO UPDATE SET
-                    descricao_oferta = EXCLUDED.descricao_oferta,
-                    percentual_desconto = EXCLUDED.percentual_desconto,
-                    data_fim = EXCLUDED.data_fim
-            """)
-            
-            conn.commit()
-            logger.info(f"Dimensão oferta atualizada: {cursor.rowcount} registros")
+            cursor.execute(f"ANALYZE {', '.join(TABELAS_ESTATISTICAS_FATO)}")
+    
+    logger.info(f"Estatísticas atualizadas: {len(TABELAS_ESTATISTICAS_FATO)} tabelas")
 
 
 def carregar_fato_vendas(**context):
@@ -440,88 +889,106 @@ def carregar_fato_vendas(**context):
     with obter_conexao_destino() as conn:
         with conn.cursor() as cursor:
             cursor.execute("""
-                INSERT INTO dw.fato_vendas (
-                    sk_tempo, sk_cliente, sk_produto, sk_regiao, sk_vendedor, sk_oferta,
-                    numero_pedido, numero_linha,
-                    quantidade_vendida, valor_unitario, valor_bruto,
-                    valor_desconto, valor_liquido, custo_total, lucro_bruto,
-                    percentual_desconto, margem_contribuicao
-                )
-                SELECT
-                    -- Chaves dimensionais
-                    TO_CHAR(soh."OrderDate"::DATE, 'YYYYMMDD')::INT AS sk_tempo,
-                    dc.sk_cliente,
-                    dp.sk_produto,
-                    dr.sk_regiao,
-                    dv.sk_vendedor,
-                    do_oferta.sk_oferta,
-                    
-                    -- Chaves de negócio
-                    soh."SalesOrderID"::INT AS numero_pedido,
-                    sod."SalesOrderDetailID"::INT AS numero_linha,
-                    
-                    -- Métricas de quantidade e valor
-                    sod."OrderQty"::INT AS quantidade_vendida,
-                    sod."UnitPrice"::NUMERIC(15,4) AS valor_unitario,
-                    (sod."UnitPrice"::NUMERIC(15,4) * sod."OrderQty"::INT) AS valor_bruto,
-                    
-                    -- Cálculo de desconto
-                    (sod."UnitPrice"::NUMERIC(15,4) * sod."OrderQty"::INT * 
-                     COALESCE(sod."UnitPriceDiscount", 0)) AS valor_desconto,
-                    
-                    -- Valor líquido (após desconto)
-                    (sod."UnitPrice"::NUMERIC(15,4) * sod."OrderQty"::INT * 
-                     (1 - COALESCE(sod."UnitPriceDiscount", 0))) AS valor_liquido,
+                WITH base AS (
+                    SELECT
+                        -- Chaves dimensionais
+                        TO_CHAR(soh."OrderDate"::DATE, 'YYYYMMDD')::INT AS sk_tempo,
+                        dc.sk_cliente,
+                        dp.sk_produto,
+                        dr.sk_regiao,
+                        dv.sk_vendedor,
+                        do_oferta.sk_oferta,
+                        
+                        -- Chaves de negócio
+                        soh."SalesOrderID"::INT AS numero_pedido,
+                        sod."SalesOrderDetailID"::INT AS numero_linha,
+                        
+                        -- Métricas de quantidade e valor (calculadas uma única vez)
+                        sod."OrderQty"::INT AS quantidade_vendida,
+                        sod."UnitPrice"::NUMERIC(15,4) AS valor_unitario,
+                        (sod."UnitPrice"::NUMERIC(15,4) * sod."OrderQty"::INT) AS valor_bruto,
+                        COALESCE(sod."UnitPriceDiscount", 0) AS taxa_desconto,
+                        (COALESCE(dp.custo_unitario, 0) * sod."OrderQty"::INT) AS custo_total
+                        
+                    FROM staging.stage_pedidos_detalhe sod
+                    INNER JOIN staging.stage_pedidos_header soh 
+                        ON soh."SalesOrderID" = sod."SalesOrderID"
+                    LEFT JOIN dw.dim_cliente dc 
+                        ON dc.nk_cliente = soh."CustomerID"::INT
+                    LEFT JOIN dw.dim_produto dp 
+                        ON dp.nk_produto = sod."ProductID"::INT
+                    LEFT JOIN dw.dim_regiao dr 
+                        ON dr.nk_regiao = soh."TerritoryID"::INT
+                    LEFT JOIN dw.dim_vendedor dv 
+                        ON dv.nk_vendedor = soh."SalesPersonID"::INT
+                    LEFT JOIN dw.dim_oferta do_oferta 
+                        ON do_oferta.nk_oferta = sod."SpecialOfferID"::INT
+                    WHERE soh."SalesOrderID" IS NOT NULL
+                        AND sod."SalesOrderDetailID" IS NOT NULL
+                    -- OFFSET 0 impede que o planner reaplique as expressões nas camadas externas
+                    OFFSET 0
+                ),
+                metricas AS (
+                    SELECT
+                        base.*,
+                        valor_bruto * taxa_desconto AS valor_desconto,
+                        valor_bruto * (1 - taxa_desconto) AS valor_liquido
+                    FROM base
+                    OFFSET 0
+                ),
+                inseridos AS (
+                    INSERT INTO dw.fato_vendas (
+                        sk_tempo, sk_cliente, sk_produto, sk_regiao, sk_vendedor, sk_oferta,
+                        numero_pedido, numero_linha,
+                        quantidade_vendida, valor_unitario, valor_bruto,
+                        valor_desconto, valor_liquido, custo_total, lucro_bruto,
+                        percentual_desconto, margem_contribuicao
+                    )
+                    SELECT
+                        sk_tempo, sk_cliente, sk_produto, sk_regiao, sk_vendedor, sk_oferta,
+                        numero_pedido, numero_linha,
+                        quantidade_vendida, valor_unitario, valor_bruto,
+                        valor_desconto, valor_liquido, custo_total,
                     
-                    -- Custo e lucro
-                    (COALESCE(dp.custo_unitario, 0) * sod."OrderQty"::INT) AS custo_total,
-                    ((sod."UnitPrice"::NUMERIC(15,4) * sod."OrderQty"::INT * 
-                      (1 - COALESCE(sod."UnitPriceDiscount", 0))) - 
-                     (COALESCE(dp.custo_unitario, 0) * sod."OrderQty"::INT)) AS lucro_bruto,
+                        -- Lucro
+                        valor_liquido - custo_total AS lucro_bruto,
                     
-                    -- Percentuais
-                    (COALESCE(sod."UnitPriceDiscount", 0) * 100)::NUMERIC(5,2) AS percentual_desconto,
+                        -- Percentuais
+                        (taxa_desconto * 100)::NUMERIC(5,2) AS percentual_desconto,
                     
-                    -- Margem de contribuição
-                    CASE 
-                        WHEN (sod."UnitPrice"::NUMERIC(15,4) * sod."OrderQty"::INT * 
-                              (1 - COALESCE(sod."UnitPriceDiscount", 0))) > 0
-                        THEN (
-                            ((sod."UnitPrice"::NUMERIC(15,4) * sod."OrderQty"::INT * 
-                              (1 - COALESCE(sod."UnitPriceDiscount", 0))) - 
-                             (COALESCE(dp.custo_unitario, 0) * sod."OrderQty"::INT)) / 
-                            (sod."UnitPrice"::NUMERIC(15,4) * sod."OrderQty"::INT * 
-                             (1 - COALESCE(sod."UnitPriceDiscount", 0))) * 100
-                        )::NUMERIC(5,2)
-                        ELSE 0
-                    END AS margem_contribuicao
+                        -- Margem de contribuição
+                        CASE 
+                            WHEN valor_liquido > 0
+                            THEN ((valor_liquido - custo_total) / valor_liquido * 100)::NUMERIC(5,2)
+                            ELSE 0
+                        END AS margem_contribuicao
                     
-                FROM staging.stage_pedidos_detalhe sod
-                INNER JOIN staging.stage_pedidos_header soh 
-                    ON soh."SalesOrderID" = sod."SalesOrderID"
-                LEFT JOIN dw.dim_cliente dc 
-                    ON dc.nk_cliente = soh."CustomerID"::INT
-                LEFT JOIN dw.dim_produto dp 
-                    ON dp.nk_produto = sod."ProductID"::INT
-                LEFT JOIN dw.dim_regiao dr 
-                    ON dr.nk_regiao = soh."TerritoryID"::INT
-                LEFT JOIN dw.dim_vendedor dv 
-                    ON dv.nk_vendedor = soh."SalesPersonID"::INT
-                LEFT JOIN dw.dim_oferta do_oferta 
-                    ON do_oferta.nk_oferta = sod."SpecialOfferID"::INT
-                WHERE soh."SalesOrderID" IS NOT NULL
-                    AND sod."SalesOrderDetailID" IS NOT NULL
-                ON CONFLICT (numero_pedido, numero_linha) DO NOTHING
+                    FROM metricas
+                    ON CONFLICT (numero_pedido, numero_linha) DO NOTHING
+                    RETURNING numero_pedido, valor_liquido, lucro_bruto
+                )
+                -- Resumo calculado apenas sobre as linhas inseridas nesta carga
+                SELECT COUNT(*), SUM(valor_liquido), SUM(lucro_bruto), MAX(numero_pedido)
+                FROM inseridos
             """)
             
+            total_inserido, receita, lucro, maior_pedido = cursor.fetchone()
+            
+            # Avança o watermark na mesma transação da fato
+            if maior_pedido is not None:
+                cursor.execute("""
+                    INSERT INTO control.etl_watermark (tabela, high_water)
+                    SELECT UNNEST(%s), %s
+                    ON CONFLICT (tabela) DO UPDATE SET
+                        high_water = GREATEST(control.etl_watermark.high_water, EXCLUDED.high_water)
+                """, (list(TABELAS_INCREMENTAIS), maior_pedido))
+            
             conn.commit()
-            total_inserido = cursor.rowcount
-            logger.info(f"Fato vendas carregado: {total_inserido} novos registros")
             
-            # Estatísticas finais
-            cursor.execute("SELECT COUNT(*), SUM(valor_liquido), SUM(lucro_bruto) FROM dw.fato_vendas")
-            stats = cursor.fetchone()
-            logger.info(f"Total no DW: {stats[0]} vendas | Receita: R$ {stats[1]:,.2f} | Lucro: R$ {stats[2]:,.2f}")
+            logger.info(
+                f"Fato vendas carregado: {total_inserido} novos registros | "
+                f"Receita: R$ {receita or 0:,.2f} | Lucro: R$ {lucro or 0:,.2f}"
+            )
 
 
 # ============================================================
@@ -536,6 +1003,10 @@ configuracao_padrao = {
     'retry_delay': timedelta(minutes=3),
 }
 
+# Pool do Airflow que limita conexões simultâneas de escrita no DW
+# (criado no airflow-init: airflow pools set dw_write 5 ...)
+POOL_ESCRITA_DW = 'dw_write'
+
 with DAG(
     dag_id='dw_adventureworks_pipeline',
     default_args=configuracao_padrao,
@@ -544,7 +1015,8 @@ with DAG(
     start_date=datetime(2025, 11, 23),
     catchup=False,
     tags=['dw', 'adventureworks', 'etl', 'analytics'],
-    max_active_runs=1
+    max_active_runs=1,
+    max_active_tasks=8
 ) as dag:
     
     # Marcadores de início e fim
@@ -578,29 +1050,18 @@ with DAG(
         doc="Checkpoint: Staging carregado"
     )
     
-    task_dim_cliente = PythonOperator(
-        task_id='carregar_dim_cliente',
-        python_callable=carregar_dimensao_cliente
-    )
-    
-    task_dim_produto = PythonOperator(
-        task_id='carregar_dim_produto',
-        python_callable=carregar_dimensao_produto
-    )
-    
-    task_dim_regiao = PythonOperator(
-        task_id='carregar_dim_regiao',
-        python_callable=carregar_dimensao_regiao
+    task_dimensoes = PythonOperator(
+        task_id='carregar_dimensoes',
+        python_callable=carregar_todas_dimensoes,
+        pool=POOL_ESCRITA_DW,
+        doc="Cliente, produto, região e oferta em uma única transação"
     )
     
+    # Vendedor lê dw.dim_regiao: executa após as demais dimensões
     task_dim_vendedor = PythonOperator(
         task_id='carregar_dim_vendedor',
-        python_callable=carregar_dimensao_vendedor
-    )
-    
-    task_dim_oferta = PythonOperator(
-        task_id='carregar_dim_oferta',
-        python_callable=carregar_dimensao_oferta
+        python_callable=carregar_dimensao_vendedor,
+        pool=POOL_ESCRITA_DW
     )
     
     # Fase 4: Carga Fato
@@ -609,6 +1070,12 @@ with DAG(
         doc="Checkpoint: Todas as dimensões carregadas"
     )
     
+    task_estatisticas = PythonOperator(
+        task_id='otimizar_estatisticas',
+        python_callable=otimizar_estatisticas,
+        doc="Executa ANALYZE em staging e dimensões antes da carga da fato"
+    )
+    
     task_fato_vendas = PythonOperator(
         task_id='carregar_fato_vendas',
         python_callable=carregar_fato_vendas,
@@ -618,12 +1085,6 @@ with DAG(
     # Definição do fluxo de execução
     inicio_pipeline >> task_dim_tempo >> task_staging >> checkpoint_staging
     
-    checkpoint_staging >> [
-        task_dim_cliente,
-        task_dim_produto,
-        task_dim_regiao,
-        task_dim_vendedor,
-        task_dim_oferta
-    ] >> checkpoint_dimensoes
+    checkpoint_staging >> task_dimensoes >> task_dim_vendedor >> checkpoint_dimensoes
     
-    checkpoint_dimensoes >> task_fato_vendas >> fim_pipeline
+    checkpoint_dimensoes >> task_estatisticas >> task_fato_vendas >> fim_pipeline
@@ -20,6 +20,7 @@ CREATE TABLE IF NOT EXISTS dw.dim_tempo (
     dia                 SMALLINT NOT NULL,
     semana_ano          SMALLINT,
     dia_semana          SMALLINT,
+    numero_dia_semana   SMALLINT,           -- ISO: 1 = segunda ... 7 = domingo
     nome_mes            VARCHAR(20),
     nome_dia_semana     VARCHAR(20),
     eh_fim_semana       BOOLEAN DEFAULT FALSE,
@@ -150,22 +151,9 @@ CREATE TABLE IF NOT EXISTS dw.fato_vendas (
 
 -- ============================================================
 -- ÍNDICES PARA OTIMIZAÇÃO DE CONSULTAS
+-- Chaves dimensionais da fato (sk_tempo, sk_cliente, sk_produto, sk_regiao,
+-- sk_vendedor): índices de cobertura em create_kpi_indexes.sql
 -- ============================================================
-CREATE INDEX IF NOT EXISTS idx_fato_vendas_tempo 
-    ON dw.fato_vendas(sk_tempo);
-    
-CREATE INDEX IF NOT EXISTS idx_fato_vendas_cliente 
-    ON dw.fato_vendas(sk_cliente);
-    
-CREATE INDEX IF NOT EXISTS idx_fato_vendas_produto 
-    ON dw.fato_vendas(sk_produto);
-    
-CREATE INDEX IF NOT EXISTS idx_fato_vendas_regiao 
-    ON dw.fato_vendas(sk_regiao);
-    
-CREATE INDEX IF NOT EXISTS idx_fato_vendas_vendedor 
-    ON dw.fato_vendas(sk_vendedor);
-    
 CREATE INDEX IF NOT EXISTS idx_fato_vendas_pedido 
     ON dw.fato_vendas(numero_pedido);
 
@@ -176,3 +164,18 @@ CREATE INDEX IF NOT EXISTS idx_fato_vendas_tempo_regiao
 -- Índice composto para análises de produto por categoria
 CREATE INDEX IF NOT EXISTS idx_produto_categoria 
     ON dw.dim_produto(categoria_produto, subcategoria_produto);
+
+-- Índice composto para sazonalidade (ordenação por trimestre e dia da semana)
+CREATE INDEX IF NOT EXISTS idx_tempo_trimestre_dia_semana 
+    ON dw.dim_tempo(trimestre, numero_dia_semana);
+
+-- ============================================================
+-- CONTROLE DE CARGA INCREMENTAL
+-- Maior chave já carregada na fato por tabela de origem
+-- ============================================================
+CREATE SCHEMA IF NOT EXISTS control;
+
+CREATE TABLE IF NOT EXISTS control.etl_watermark (
+    tabela              TEXT PRIMARY KEY,
+    high_water          BIGINT NOT NULL
+);
@@ -0,0 +1,44 @@
+-- ============================================================================
+-- ÍNDICES DE COBERTURA PARA OS KPIs - DATA WAREHOUSE ADVENTUREWORKS
+-- Arquivo: create_kpi_indexes.sql
+-- Descrição: Índices por chave dimensional com INCLUDE das métricas agregadas,
+--            permitindo index-only scan da fato nas views de KPI
+--            Conferência: python test_kpis.py --verificar-indices
+-- Data: 23/11/2025
+-- ============================================================================
+
+-- Produto: KPIs 1, 5, 7 e 10
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_fv_produto_incl
+    ON dw.fato_vendas(sk_produto)
+    INCLUDE (valor_liquido, lucro_bruto, quantidade_vendida, numero_pedido, custo_total);
+
+-- Tempo: KPIs 4 e 9
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_fv_tempo_incl
+    ON dw.fato_vendas(sk_tempo)
+    INCLUDE (valor_liquido, lucro_bruto, quantidade_vendida, numero_pedido, sk_cliente);
+
+-- Vendedor: KPI 3
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_fv_vendedor_incl
+    ON dw.fato_vendas(sk_vendedor)
+    INCLUDE (sk_regiao, valor_liquido, lucro_bruto, numero_pedido);
+
+-- Região: KPI 6
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_fv_regiao_incl
+    ON dw.fato_vendas(sk_regiao)
+    INCLUDE (valor_liquido, lucro_bruto, quantidade_vendida, numero_pedido, sk_cliente);
+
+-- Cliente: KPI 8
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_fv_cliente_incl
+    ON dw.fato_vendas(sk_cliente)
+    INCLUDE (valor_liquido, lucro_bruto, numero_pedido);
+
+-- Índices simples nas mesmas chaves, substituídos pelos de cobertura acima
+-- (bancos criados antes deste script); cada INSERT na fato deixa de mantê-los
+DROP INDEX CONCURRENTLY IF EXISTS dw.idx_fato_vendas_tempo;
+DROP INDEX CONCURRENTLY IF EXISTS dw.idx_fato_vendas_cliente;
+DROP INDEX CONCURRENTLY IF EXISTS dw.idx_fato_vendas_produto;
+DROP INDEX CONCURRENTLY IF EXISTS dw.idx_fato_vendas_regiao;
+DROP INDEX CONCURRENTLY IF EXISTS dw.idx_fato_vendas_vendedor;
+
+-- VACUUM atualiza o visibility map (pré-requisito do index-only scan) e ANALYZE as estatísticas
+VACUUM (ANALYZE) dw.fato_vendas;
@@ -0,0 +1,319 @@
+-- ============================================================================
+-- VIEWS MATERIALIZADAS DE KPIs - DATA WAREHOUSE ADVENTUREWORKS
+-- Arquivo: create_kpi_views.sql
+-- Descrição: Agregações dos KPIs pré-calculadas (uma view por KPI ou grupo de KPIs)
+--            Ordenação e LIMIT ficam na leitura (test_kpis.py)
+--            Atualização após cada carga: refresh_all() em test_kpis.py
+-- Data: 23/11/2025
+-- ============================================================================
+
+-- Contagens distintas aproximadas (HyperLogLog): log2m = 14 (16.384 registradores) dá erro
+-- padrão de ~0,8% (1,04 / sqrt(2^14)); o padrão da extensão (log2m = 11) ficaria em ~2,3%.
+-- Só a representação explícita (grupos pequenos, abaixo do limiar automático da extensão) é exata
+CREATE EXTENSION IF NOT EXISTS hll;
+
+-- Versão das views: atualizada por refresh_all() na mesma transação do refresh,
+-- invalida o cache de resultados de test_kpis.py
+CREATE TABLE IF NOT EXISTS dw.etl_meta (
+    chave VARCHAR(50) PRIMARY KEY,
+    atualizado_em TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO dw.etl_meta (chave) VALUES ('views_kpi')
+ON CONFLICT (chave) DO NOTHING;
+
+-- ============================================================================
+-- KPIs 1, 5, 7 e 10: Produto e Categoria (uma única varredura da fato)
+-- GROUPING SETS: linhas nivel = 'produto' (KPI 1, 5 e 10) e nivel = 'categoria' (KPI 7)
+-- Colunas *_positiva aplicam o filtro valor_liquido > 0 do KPI 1
+-- ============================================================================
+CREATE MATERIALIZED VIEW IF NOT EXISTS dw.mv_kpi_produto AS
+SELECT
+    CASE GROUPING(p.nome_produto) WHEN 0 THEN 'produto' ELSE 'categoria' END AS nivel,
+    p.sk_produto,
+    p.categoria_produto,
+    p.subcategoria_produto,
+    p.nome_produto,
+    
+    -- Todas as vendas (KPI 7 e 10)
+    hll_cardinality(hll_add_agg(hll_hash_bigint(p.sk_produto), 14))::BIGINT AS total_produtos,
+    hll_cardinality(hll_add_agg(hll_hash_bigint(fv.numero_pedido), 14))::BIGINT AS total_pedidos,
+    SUM(fv.quantidade_vendida) AS quantidade_vendida,
+    SUM(fv.valor_liquido) AS receita,
+    SUM(fv.custo_total) AS custo,
+    SUM(fv.lucro_bruto) AS lucro,
+    
+    -- Apenas vendas com valor líquido positivo (KPI 1)
+    hll_cardinality(hll_add_agg(hll_hash_bigint(fv.numero_pedido), 14) FILTER (WHERE fv.valor_liquido > 0))::BIGINT AS pedidos_positiva,
+    SUM(fv.quantidade_vendida) FILTER (WHERE fv.valor_liquido > 0) AS quantidade_positiva,
+    SUM(fv.valor_liquido) FILTER (WHERE fv.valor_liquido > 0) AS receita_positiva,
+    SUM(fv.lucro_bruto) FILTER (WHERE fv.valor_liquido > 0) AS lucro_positiva
+FROM dw.fato_vendas fv
+INNER JOIN dw.dim_produto p ON fv.sk_produto = p.sk_produto
+GROUP BY GROUPING SETS (
+    (p.sk_produto, p.categoria_produto, p.subcategoria_produto, p.nome_produto),
+    (p.categoria_produto)
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uk_mv_kpi_produto
+    ON dw.mv_kpi_produto(nivel, categoria_produto, subcategoria_produto, nome_produto, sk_produto)
+    NULLS NOT DISTINCT;
+
+CREATE INDEX IF NOT EXISTS idx_mv_kpi_produto_receita
+    ON dw.mv_kpi_produto(nivel, receita DESC);
+
+-- ============================================================================
+-- KPI 2: Análise de Efetividade de Descontos
+-- ============================================================================
+CREATE MATERIALIZED VIEW IF NOT EXISTS dw.mv_kpi2 AS
+WITH por_faixa AS (
+    SELECT
+        -- Faixa por busca nos limites (0 = sem desconto ... 4 = acima de 30%);
+        -- percentual_desconto tem 2 casas, então 10.00 ainda cai na faixa 1
+        COALESCE(
+            width_bucket(fv.percentual_desconto, ARRAY[0.0001, 10.0001, 20.0001, 30.0001]::NUMERIC[]),
+            4
+        ) AS faixa_bucket,
+        COUNT(*) AS numero_transacoes,
+        SUM(fv.quantidade_vendida) AS unidades_vendidas,
+        ROUND(SUM(fv.valor_bruto), 2) AS valor_bruto_total,
+        ROUND(SUM(fv.valor_desconto), 2) AS desconto_concedido,
+        ROUND(SUM(fv.valor_liquido), 2) AS receita_liquida,
+        ROUND(SUM(fv.lucro_bruto), 2) AS lucro_total,
+        ROUND(SUM(fv.lucro_bruto) / NULLIF(SUM(fv.valor_liquido), 0) * 100, 2) AS margem_media_pct,
+        ROUND(SUM(fv.valor_desconto) / NULLIF(SUM(fv.valor_bruto), 0) * 100, 2) AS taxa_desconto_media_pct
+    FROM dw.fato_vendas fv
+    GROUP BY 1
+)
+SELECT
+    f.faixa_desconto,
+    b.numero_transacoes,
+    b.unidades_vendidas,
+    b.valor_bruto_total,
+    b.desconto_concedido,
+    b.receita_liquida,
+    b.lucro_total,
+    b.margem_media_pct,
+    b.taxa_desconto_media_pct
+FROM por_faixa b
+INNER JOIN (
+    VALUES (0, 'Sem Desconto'), (1, '1-10%'), (2, '11-20%'), (3, '21-30%'), (4, 'Acima de 30%')
+) AS f(faixa_bucket, faixa_desconto) ON f.faixa_bucket = b.faixa_bucket;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uk_mv_kpi2
+    ON dw.mv_kpi2(faixa_desconto);
+
+-- ============================================================================
+-- KPI 3: Performance de Vendedores por Região
+-- ============================================================================
+CREATE MATERIALIZED VIEW IF NOT EXISTS dw.mv_kpi3 AS
+SELECT
+    r.grupo_regional,
+    r.nome_territorio,
+    v.nome_vendedor,
+    v.meta_anual,
+    hll_cardinality(hll_add_agg(hll_hash_bigint(fv.numero_pedido), 14))::BIGINT AS total_vendas,
+    ROUND(SUM(fv.valor_liquido), 2) AS receita_gerada,
+    ROUND(SUM(fv.lucro_bruto), 2) AS lucro_gerado,
+    ROUND(SUM(fv.valor_liquido) / NULLIF(v.meta_anual, 0) * 100, 2) AS percentual_meta_atingido,
+    ROUND(SUM(fv.valor_liquido) / NULLIF(hll_cardinality(hll_add_agg(hll_hash_bigint(fv.numero_pedido), 14))::BIGINT, 0), 2) AS ticket_medio_vendedor,
+    ROUND(SUM(fv.lucro_bruto) / NULLIF(SUM(fv.valor_liquido), 0) * 100, 2) AS margem_media_pct
+FROM dw.fato_vendas fv
+INNER JOIN dw.dim_vendedor v ON fv.sk_vendedor = v.sk_vendedor
+INNER JOIN dw.dim_regiao r ON fv.sk_regiao = r.sk_regiao
+WHERE v.meta_anual > 0
+GROUP BY r.grupo_regional, r.nome_territorio, v.nome_vendedor, v.meta_anual;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uk_mv_kpi3
+    ON dw.mv_kpi3(grupo_regional, nome_territorio, nome_vendedor, meta_anual);
+
+CREATE INDEX IF NOT EXISTS idx_mv_kpi3_receita
+    ON dw.mv_kpi3(receita_gerada DESC);
+
+-- ============================================================================
+-- KPI 4: Evolução Temporal de Receita e Lucratividade
+-- ============================================================================
+CREATE MATERIALIZED VIEW IF NOT EXISTS dw.mv_kpi4 AS
+WITH metricas_mensais AS (
+    SELECT
+        t.ano,
+        t.mes,
+        t.nome_mes,
+        SUM(fv.valor_liquido) AS receita_mes,
+        SUM(fv.lucro_bruto) AS lucro_mes,
+        hll_cardinality(hll_add_agg(hll_hash_bigint(fv.numero_pedido), 14))::BIGINT AS pedidos_mes,
+        hll_cardinality(hll_add_agg(hll_hash_bigint(fv.sk_cliente), 14))::BIGINT AS clientes_unicos
+    FROM dw.fato_vendas fv
+    INNER JOIN dw.dim_tempo t ON fv.sk_tempo = t.sk_tempo
+    GROUP BY t.ano, t.mes, t.nome_mes
+)
+SELECT
+    ano,
+    mes,
+    nome_mes,
+    ROUND(receita_mes, 2) AS receita_mensal,
+    ROUND(lucro_mes, 2) AS lucro_mensal,
+    ROUND(lucro_mes / NULLIF(receita_mes, 0) * 100, 2) AS margem_lucro_pct,
+    pedidos_mes,
+    clientes_unicos,
+    ROUND(receita_mes / NULLIF(pedidos_mes, 0), 2) AS ticket_medio
+FROM metricas_mensais;
+
+-- Também atende ORDER BY ano DESC, mes DESC (varredura reversa)
+CREATE UNIQUE INDEX IF NOT EXISTS uk_mv_kpi4
+    ON dw.mv_kpi4(ano, mes);
+
+-- ============================================================================
+-- KPI 5: Análise ABC de Produtos
+-- Derivada das linhas de produto de mv_kpi_produto, sem nova varredura da fato
+-- (refresh_all atualiza mv_kpi_produto antes, na mesma transação)
+-- sk_produto mantido apenas como chave única da view
+-- ============================================================================
+CREATE MATERIALIZED VIEW IF NOT EXISTS dw.mv_kpi5 AS
+WITH ranking_produtos AS (
+    SELECT
+        sk_produto,
+        nome_produto,
+        categoria_produto,
+        receita AS receita_produto,
+        quantidade_vendida
+    FROM dw.mv_kpi_produto
+    WHERE nivel = 'produto'
+),
+-- Total geral calculado uma vez sobre as linhas já agregadas (sem janela)
+total AS (
+    SELECT SUM(receita_produto) AS receita_geral FROM ranking_produtos
+),
+acumulado AS (
+    SELECT
+        *,
+        SUM(receita_produto) OVER (ORDER BY receita_produto DESC) AS receita_acumulada,
+        ROUND(
+            SUM(receita_produto) OVER (ORDER BY receita_produto DESC) /
+            NULLIF((SELECT receita_geral FROM total), 0) * 100,
+            2
+        ) AS percentual_acumulado
+    FROM ranking_produtos
+)
+SELECT
+    sk_produto,
+    nome_produto,
+    categoria_produto,
+    ROUND(receita_produto, 2) AS receita,
+    quantidade_vendida,
+    percentual_acumulado,
+    CASE
+        WHEN percentual_acumulado <= 80 THEN 'A - Alto Valor'
+        WHEN percentual_acumulado <= 95 THEN 'B - Médio Valor'
+        ELSE 'C - Baixo Valor'
+    END AS classificacao_abc
+FROM acumulado;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uk_mv_kpi5
+    ON dw.mv_kpi5(sk_produto);
+
+CREATE INDEX IF NOT EXISTS idx_mv_kpi5_receita
+    ON dw.mv_kpi5(receita DESC);
+
+-- ============================================================================
+-- KPI 6: Concentração Geográfica de Vendas
+-- ============================================================================
+CREATE MATERIALIZED VIEW IF NOT EXISTS dw.mv_kpi6 AS
+WITH por_territorio AS (
+    SELECT
+        r.continente,
+        r.grupo_regional,
+        r.nome_territorio,
+        hll_cardinality(hll_add_agg(hll_hash_bigint(fv.sk_cliente), 14))::BIGINT AS total_clientes,
+        hll_cardinality(hll_add_agg(hll_hash_bigint(fv.numero_pedido), 14))::BIGINT AS total_pedidos,
+        SUM(fv.quantidade_vendida) AS unidades_vendidas,
+        SUM(fv.valor_liquido) AS receita,
+        SUM(fv.lucro_bruto) AS lucro
+    FROM dw.fato_vendas fv
+    INNER JOIN dw.dim_regiao r ON fv.sk_regiao = r.sk_regiao
+    GROUP BY r.continente, r.grupo_regional, r.nome_territorio
+),
+-- Total geral calculado uma vez sobre as linhas já agregadas (sem janela)
+total AS (
+    SELECT SUM(receita) AS receita_geral FROM por_territorio
+)
+SELECT
+    continente,
+    grupo_regional,
+    nome_territorio,
+    total_clientes,
+    total_pedidos,
+    unidades_vendidas,
+    ROUND(receita, 2) AS receita_total,
+    ROUND(lucro, 2) AS lucro_total,
+    ROUND(lucro / NULLIF(receita, 0) * 100, 2) AS margem_media_pct,
+    ROUND(receita / NULLIF((SELECT receita_geral FROM total), 0) * 100, 2) AS participacao_receita_pct,
+    ROUND(receita / NULLIF(total_pedidos, 0), 2) AS ticket_medio_regiao
+FROM por_territorio;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uk_mv_kpi6
+    ON dw.mv_kpi6(continente, grupo_regional, nome_territorio);
+
+CREATE INDEX IF NOT EXISTS idx_mv_kpi6_receita
+    ON dw.mv_kpi6(receita_total DESC);
+
+-- ============================================================================
+-- KPI 8: Customer Lifetime Value por Segmento
+-- ============================================================================
+CREATE MATERIALIZED VIEW IF NOT EXISTS dw.mv_kpi8 AS
+WITH metricas_cliente AS (
+    SELECT
+        c.tipo_cliente,
+        c.segmento,
+        hll_cardinality(hll_add_agg(hll_hash_bigint(fv.sk_cliente), 14))::BIGINT AS total_clientes,
+        SUM(fv.valor_liquido) AS receita_total_segmento,
+        SUM(fv.lucro_bruto) AS lucro_total_segmento,
+        hll_cardinality(hll_add_agg(hll_hash_bigint(fv.numero_pedido), 14))::BIGINT AS total_pedidos,
+        AVG(fv.valor_liquido) AS ticket_medio
+    FROM dw.fato_vendas fv
+    INNER JOIN dw.dim_cliente c ON fv.sk_cliente = c.sk_cliente
+    GROUP BY c.tipo_cliente, c.segmento
+)
+SELECT
+    tipo_cliente,
+    segmento,
+    total_clientes,
+    ROUND(receita_total_segmento, 2) AS receita_total,
+    ROUND(lucro_total_segmento, 2) AS lucro_total,
+    ROUND(receita_total_segmento / NULLIF(total_clientes, 0), 2) AS receita_media_por_cliente,
+    ROUND(lucro_total_segmento / NULLIF(total_clientes, 0), 2) AS lucro_medio_por_cliente,
+    ROUND(total_pedidos::NUMERIC / NULLIF(total_clientes, 0), 2) AS pedidos_por_cliente,
+    ROUND(ticket_medio, 2) AS ticket_medio,
+    CASE
+        WHEN receita_total_segmento / NULLIF(total_clientes, 0) >= 50000 THEN 'VIP'
+        WHEN receita_total_segmento / NULLIF(total_clientes, 0) >= 20000 THEN 'Premium'
+        WHEN receita_total_segmento / NULLIF(total_clientes, 0) >= 5000 THEN 'Regular'
+        ELSE 'Basico'
+    END AS categoria_segmento
+FROM metricas_cliente;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uk_mv_kpi8
+    ON dw.mv_kpi8(tipo_cliente, segmento);
+
+-- ============================================================================
+-- KPI 9: Análise de Sazonalidade
+-- ============================================================================
+CREATE MATERIALIZED VIEW IF NOT EXISTS dw.mv_kpi9 AS
+SELECT
+    t.trimestre,
+    t.numero_dia_semana,
+    t.nome_dia_semana,
+    t.eh_fim_semana,
+    hll_cardinality(hll_add_agg(hll_hash_bigint(fv.numero_pedido), 14))::BIGINT AS total_vendas,
+    SUM(fv.quantidade_vendida) AS unidades_vendidas,
+    ROUND(SUM(fv.valor_liquido), 2) AS receita_total,
+    ROUND(AVG(fv.valor_liquido), 2) AS valor_medio_transacao,
+    ROUND(SUM(fv.lucro_bruto), 2) AS lucro_total,
+    ROUND(SUM(fv.lucro_bruto) / NULLIF(SUM(fv.valor_liquido), 0) * 100, 2) AS margem_media_pct
+FROM dw.fato_vendas fv
+INNER JOIN dw.dim_tempo t ON fv.sk_tempo = t.sk_tempo
+GROUP BY t.trimestre, t.numero_dia_semana, t.nome_dia_semana, t.eh_fim_semana;
+
+-- Também atende ORDER BY trimestre, numero_dia_semana
+CREATE UNIQUE INDEX IF NOT EXISTS uk_mv_kpi9
+    ON dw.mv_kpi9(trimestre, numero_dia_semana);
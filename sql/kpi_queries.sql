@@ -9,7 +9,7 @@
 -- KPI 1: Margem de Contribuição Média por Produto
 -- ============================================================================
 -- Objetivo: Identificar produtos com melhor rentabilidade
--- Métrica: Margem de contribuição média em percentual
+-- Métrica: Margem de contribuição em percentual (lucro bruto / receita líquida)
 -- Critérios: Apenas produtos com receita > R$ 1.000
 -- ============================================================================
 
@@ -21,8 +21,7 @@ SELECT
     SUM(fv.quantidade_vendida) AS quantidade_total_vendida,
     SUM(fv.valor_liquido) AS receita_liquida,
     SUM(fv.lucro_bruto) AS lucro_bruto,
-    ROUND(AVG(fv.margem_contribuicao), 2) AS margem_contribuicao_media_pct,
-    ROUND(SUM(fv.lucro_bruto) / NULLIF(SUM(fv.valor_liquido), 0) * 100, 2) AS rentabilidade_pct
+    ROUND(SUM(fv.lucro_bruto) / NULLIF(SUM(fv.valor_liquido), 0) * 100, 2) AS margem_contribuicao_media_pct
 FROM dw.fato_vendas fv
 INNER JOIN dw.dim_produto p ON fv.sk_produto = p.sk_produto
 WHERE fv.valor_liquido > 0
@@ -54,7 +53,7 @@ SELECT
     ROUND(SUM(fv.valor_desconto), 2) AS desconto_concedido,
     ROUND(SUM(fv.valor_liquido), 2) AS receita_liquida,
     ROUND(SUM(fv.lucro_bruto), 2) AS lucro_total,
-    ROUND(AVG(fv.margem_contribuicao), 2) AS margem_media_pct,
+    ROUND(SUM(fv.lucro_bruto) / NULLIF(SUM(fv.valor_liquido), 0) * 100, 2) AS margem_media_pct,
     ROUND(SUM(fv.valor_desconto) / NULLIF(SUM(fv.valor_bruto), 0) * 100, 2) AS taxa_desconto_media_pct
 FROM dw.fato_vendas fv
 GROUP BY 1
@@ -79,7 +78,7 @@ SELECT
     ROUND(SUM(fv.lucro_bruto), 2) AS lucro_gerado,
     ROUND(SUM(fv.valor_liquido) / NULLIF(v.meta_anual, 0) * 100, 2) AS percentual_meta_atingido,
     ROUND(SUM(fv.valor_liquido) / NULLIF(COUNT(DISTINCT fv.numero_pedido), 0), 2) AS ticket_medio_vendedor,
-    ROUND(AVG(fv.margem_contribuicao), 2) AS margem_media_pct
+    ROUND(SUM(fv.lucro_bruto) / NULLIF(SUM(fv.valor_liquido), 0) * 100, 2) AS margem_media_pct
 FROM dw.fato_vendas fv
 INNER JOIN dw.dim_vendedor v ON fv.sk_vendedor = v.sk_vendedor
 INNER JOIN dw.dim_regiao r ON fv.sk_regiao = r.sk_regiao
@@ -189,7 +188,7 @@ SELECT
     SUM(fv.quantidade_vendida) AS unidades_vendidas,
     ROUND(SUM(fv.valor_liquido), 2) AS receita_total,
     ROUND(SUM(fv.lucro_bruto), 2) AS lucro_total,
-    ROUND(AVG(fv.margem_contribuicao), 2) AS margem_media_pct,
+    ROUND(SUM(fv.lucro_bruto) / NULLIF(SUM(fv.valor_liquido), 0) * 100, 2) AS margem_media_pct,
     ROUND(
         SUM(fv.valor_liquido) / NULLIF(SUM(SUM(fv.valor_liquido)) OVER (), 0) * 100, 
         2
@@ -289,7 +288,7 @@ SELECT
     ROUND(SUM(fv.valor_liquido), 2) AS receita_total,
     ROUND(AVG(fv.valor_liquido), 2) AS valor_medio_transacao,
     ROUND(SUM(fv.lucro_bruto), 2) AS lucro_total,
-    ROUND(AVG(fv.margem_contribuicao), 2) AS margem_media_pct
+    ROUND(SUM(fv.lucro_bruto) / NULLIF(SUM(fv.valor_liquido), 0) * 100, 2) AS margem_media_pct
 FROM dw.fato_vendas fv
 INNER JOIN dw.dim_tempo t ON fv.sk_tempo = t.sk_tempo
 GROUP BY t.trimestre, t.nome_dia_semana, t.eh_fim_semana
@@ -320,7 +319,7 @@ SELECT
     SUM(fv.quantidade_vendida) AS quantidade_vendida,
     ROUND(SUM(fv.valor_liquido), 2) AS receita_total,
     ROUND(SUM(fv.lucro_bruto), 2) AS lucro_total,
-    ROUND(AVG(fv.margem_contribuicao), 2) AS margem_media_pct,
+    ROUND(SUM(fv.lucro_bruto) / NULLIF(SUM(fv.valor_liquido), 0) * 100, 2) AS margem_media_pct,
     ROUND(SUM(fv.valor_liquido) / NULLIF(SUM(fv.quantidade_vendida), 0), 2) AS preco_medio_unitario
 FROM dw.fato_vendas fv
 INNER JOIN dw.dim_produto p ON fv.sk_produto = p.sk_produto
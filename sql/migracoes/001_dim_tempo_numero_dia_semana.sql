@@ -0,0 +1,26 @@
+-- ============================================================================
+-- MIGRAÇÃO 001 - DATA WAREHOUSE ADVENTUREWORKS
+-- Arquivo: migracoes/001_dim_tempo_numero_dia_semana.sql
+-- Descrição: Adiciona dw.dim_tempo.numero_dia_semana (ISO: 1 = segunda ... 7 = domingo)
+--            em bancos criados antes da coluna existir em create_dw_schema.sql
+--            Bancos novos já nascem com a coluna; executar uma única vez, antes de
+--            create_kpi_views.sql (mv_kpi9 agrupa por ela)
+-- Execução:   psql -h localhost -p 5433 -U dw_user -d dw_adventureworks \
+--                 -f sql/migracoes/001_dim_tempo_numero_dia_semana.sql
+-- Data: 23/11/2025
+-- ============================================================================
+
+BEGIN;
+
+ALTER TABLE dw.dim_tempo ADD COLUMN IF NOT EXISTS numero_dia_semana SMALLINT;
+
+UPDATE dw.dim_tempo
+SET numero_dia_semana = EXTRACT(ISODOW FROM data_completa)::SMALLINT
+WHERE numero_dia_semana IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_tempo_trimestre_dia_semana
+    ON dw.dim_tempo(trimestre, numero_dia_semana);
+
+COMMIT;
+
+ANALYZE dw.dim_tempo;
@@ -0,0 +1,47 @@
+-- ============================================================================
+-- FATO DE VENDAS EM ARMAZENAMENTO COLUNAR (OPCIONAL) - DATA WAREHOUSE ADVENTUREWORKS
+-- Arquivo: opcional/converter_fato_columnar.sql
+-- Descrição: Converte dw.fato_vendas para o access method columnar (Citus columnar),
+--            comprimido com zstd; as varreduras dos KPIs leem só as colunas projetadas
+--            Não é executado na criação do container (subpasta ignorada pelo initdb)
+-- Requisitos: pacote do Citus na imagem do DW (ex.: postgresql-15-citus-12.1 do
+--            repositório da Citus Data, ou imagem citusdata/citus:12.1-pg15)
+-- Execução:   psql -h localhost -p 5433 -U dw_user -d dw_adventureworks \
+--                 -f sql/opcional/converter_fato_columnar.sql
+-- Data: 23/11/2025
+-- ============================================================================
+--
+-- Observações:
+--   * SET ACCESS METHOD (PostgreSQL 15) reescreve a tabela mantendo o mesmo OID:
+--     views materializadas, chaves estrangeiras, índices e o INSERT do ETL continuam
+--     apontando para dw.fato_vendas, sem RENAME nem recriação de dependências
+--   * Tabelas colunares não têm UPDATE/DELETE; a carga da fato usa apenas
+--     INSERT ... ON CONFLICT DO NOTHING, que é suportado
+--   * Não há index-only scan em tabelas colunares: os índices de cobertura de
+--     create_kpi_indexes.sql deixam de ajudar e podem ser removidos
+--   * Reversão: ALTER TABLE dw.fato_vendas SET ACCESS METHOD heap;
+
+CREATE EXTENSION IF NOT EXISTS citus_columnar;
+
+-- Opções aplicadas às tabelas convertidas nesta sessão
+SET columnar.compression = 'zstd';
+SET columnar.stripe_row_limit = 150000;
+
+-- Reescrita com lock exclusivo: executar fora da janela do ETL
+BEGIN;
+
+ALTER TABLE dw.fato_vendas SET ACCESS METHOD columnar;
+
+COMMIT;
+
+-- Estatísticas para o planner após a reescrita
+ANALYZE dw.fato_vendas;
+
+-- Conferência: tamanho em disco e access method
+SELECT
+    c.relname,
+    a.amname AS access_method,
+    pg_size_pretty(pg_total_relation_size(c.oid)) AS tamanho_total
+FROM pg_class c
+INNER JOIN pg_am a ON c.relam = a.oid
+WHERE c.oid = 'dw.fato_vendas'::regclass;
@@ -1,12 +1,23 @@
 """
 Script para testar KPIs do Data Warehouse AdventureWorks
-Executa as queries de KPI e exibe os resultados
+Executa as queries de KPI em paralelo e exibe os resultados
 """
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from psycopg2.pool import ThreadedConnectionPool
 import psycopg2
-import pandas as pd
-from datetime import datetime
+import psycopg2.errors
+from tabulate import tabulate
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+import hashlib
+import json
+import os
 import sys
+import tempfile
+import threading
 
 # Configurações de conexão com o PostgreSQL DW
 DB_CONFIG = {
@@ -17,8 +28,150 @@ DB_CONFIG = {
     'password': 'dw_password'
 }
 
-def conectar_db():
-    """Estabelece conexão com o banco de dados DW"""
+# Pool de conexões das leituras de KPI, criado só quando algum KPI não está em cache
+# (importar o módulo não conecta): uma conexão aberta de início e as demais sob demanda,
+# conectando em paralelo nas threads
+MIN_CONEXOES_KPI = 1
+MAX_CONEXOES_KPI = 10
+_pool_kpi = None
+_trava_pool_kpi = threading.Lock()
+
+# Sessões que agregam a fato (refresh das views e EXPLAIN): JIT, memória para hash/sort
+# e custos de paralelismo reduzidos para que as varreduras da fato usem Gather com workers
+# As leituras dos KPIs ficam com os padrões, pois o custo de compilação superaria a consulta
+OPCOES_SESSAO_ANALITICA = (
+    "-c jit=on "
+    "-c jit_above_cost=10000 "
+    "-c jit_inline_above_cost=50000 "
+    "-c jit_optimize_above_cost=100000 "
+    "-c work_mem=256MB "
+    "-c max_parallel_workers_per_gather=8 "
+    "-c parallel_setup_cost=10 "
+    "-c parallel_tuple_cost=0.01 "
+    "-c min_parallel_table_scan_size=8MB"
+)
+
+# Cache local dos resultados (JSON), válido enquanto dw.etl_meta não registrar novo refresh
+# Diretório do próprio usuário com permissão 0700, fora do temporário compartilhado
+DIRETORIO_CACHE = (
+    Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "dw_adventureworks" / "kpi"
+)
+
+# Definição dos KPIs: (número, título, query)
+# Agregações pré-calculadas em sql/create_kpi_views.sql; aqui só ordenação e LIMIT
+KPIS = [
+    (1, "Margem de Contribuição Média por Produto", """
+    SELECT 
+        categoria_produto,
+        subcategoria_produto,
+        nome_produto,
+        pedidos_positiva AS total_pedidos,
+        quantidade_positiva AS quantidade_total_vendida,
+        receita_positiva AS receita_liquida,
+        lucro_positiva AS lucro_bruto,
+        ROUND(lucro_positiva / NULLIF(receita_positiva, 0) * 100, 2) AS margem_contribuicao_media_pct
+    FROM dw.mv_kpi_produto
+    WHERE nivel = 'produto'
+        AND receita_positiva > 1000
+    ORDER BY margem_contribuicao_media_pct DESC
+    LIMIT 20
+    """),
+    (2, "Análise de Efetividade de Descontos",
+     "SELECT * FROM dw.mv_kpi2 ORDER BY faixa_desconto"),
+    (3, "Performance de Vendedores por Região",
+     "SELECT * FROM dw.mv_kpi3 ORDER BY receita_gerada DESC LIMIT 15"),
+    (4, "Evolução Temporal de Receita e Lucratividade",
+     "SELECT * FROM dw.mv_kpi4 ORDER BY ano DESC, mes DESC LIMIT 12"),
+    (5, "Análise ABC de Produtos", """
+    SELECT nome_produto, categoria_produto, receita, quantidade_vendida,
+           percentual_acumulado, classificacao_abc
+    FROM dw.mv_kpi5
+    ORDER BY receita DESC
+    LIMIT 30
+    """),
+    (6, "Concentração Geográfica de Vendas",
+     "SELECT * FROM dw.mv_kpi6 ORDER BY receita_total DESC LIMIT 15"),
+    (7, "Eficiência Operacional por Categoria", """
+    WITH total AS (
+        SELECT SUM(receita) AS receita_geral
+        FROM dw.mv_kpi_produto
+        WHERE nivel = 'categoria'
+    )
+    SELECT 
+        categoria_produto,
+        total_produtos AS total_produtos_categoria,
+        total_pedidos AS total_transacoes,
+        quantidade_vendida AS unidades_vendidas,
+        ROUND(receita, 2) AS receita_categoria,
+        ROUND(custo, 2) AS custo_categoria,
+        ROUND(lucro, 2) AS lucro_categoria,
+        ROUND(lucro / NULLIF(receita, 0) * 100, 2) AS margem_lucro_pct,
+        ROUND(receita / NULLIF(total_produtos, 0), 2) AS receita_media_produto,
+        ROUND(quantidade_vendida / NULLIF(total_produtos, 0), 2) AS giro_medio_produto,
+        ROUND(receita / NULLIF(total.receita_geral, 0) * 100, 2) AS participacao_receita_total_pct
+    FROM dw.mv_kpi_produto
+    CROSS JOIN total
+    WHERE nivel = 'categoria'
+    ORDER BY receita_categoria DESC
+    """),
+    (8, "Customer Lifetime Value por Segmento",
+     "SELECT * FROM dw.mv_kpi8 ORDER BY receita_total DESC"),
+    (9, "Análise de Sazonalidade", """
+    SELECT 
+        trimestre,
+        nome_dia_semana,
+        eh_fim_semana,
+        total_vendas,
+        unidades_vendidas,
+        receita_total,
+        valor_medio_transacao,
+        lucro_total,
+        margem_media_pct
+    FROM dw.mv_kpi9
+    ORDER BY trimestre, numero_dia_semana
+    """),
+    (10, "Top 10 Produtos por Receita", """
+    SELECT 
+        categoria_produto,
+        nome_produto,
+        total_pedidos,
+        quantidade_vendida,
+        ROUND(receita, 2) AS receita_total,
+        ROUND(lucro, 2) AS lucro_total,
+        ROUND(lucro / NULLIF(receita, 0) * 100, 2) AS margem_media_pct,
+        ROUND(receita / NULLIF(quantidade_vendida, 0), 2) AS preco_medio_unitario
+    FROM dw.mv_kpi_produto
+    WHERE nivel = 'produto'
+    ORDER BY receita DESC
+    LIMIT 10
+    """),
+]
+
+# Views materializadas atualizadas por refresh_all, nesta ordem (KPIs 1, 7 e 10 compartilham
+# mv_kpi_produto, e mv_kpi5 é derivada dela)
+VIEWS_KPI = [
+    "dw.mv_kpi_produto",
+    "dw.mv_kpi2",
+    "dw.mv_kpi3",
+    "dw.mv_kpi4",
+    "dw.mv_kpi5",
+    "dw.mv_kpi6",
+    "dw.mv_kpi8",
+    "dw.mv_kpi9",
+]
+
+class ConexaoKPI(psycopg2.extensions.connection):
+    """Conexão que registra quais KPIs já possuem prepared statement na sessão"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.kpis_preparados = set()
+
+def conectar_db(opcoes=None):
+    """
+    Estabelece conexão dedicada com o banco de dados DW (refresh e EXPLAIN)
+    opcoes: parâmetros de sessão enviados na conexão (options do libpq), sem SETs extras
+    """
     try:
         conn = psycopg2.connect(
             host=DB_CONFIG['host'],
@@ -26,9 +179,10 @@ def conectar_db():
             database=DB_CONFIG['database'],
             user=DB_CONFIG['user'],
             password=DB_CONFIG['password'],
-            client_encoding='utf8'
+            client_encoding='utf8',
+            options=opcoes,
+            connection_factory=ConexaoKPI
         )
-        print("[OK] Conexao estabelecida com o Data Warehouse")
         return conn
     except Exception as e:
         print(f"[ERRO] Erro ao conectar ao banco de dados: {e}")
@@ -36,24 +190,238 @@ def conectar_db():
         traceback.print_exc()
         sys.exit(1)
 
-def executar_kpi(conn, titulo, query, num_kpi):
-    """Executa uma query de KPI e exibe os resultados"""
+def obter_pool_kpi():
+    """Pool de conexões das leituras de KPI, criado uma vez por processo"""
+    global _pool_kpi
+    with _trava_pool_kpi:
+        if _pool_kpi is None:
+            try:
+                _pool_kpi = ThreadedConnectionPool(
+                    MIN_CONEXOES_KPI, MAX_CONEXOES_KPI,
+                    client_encoding='utf8',
+                    connection_factory=ConexaoKPI,
+                    **DB_CONFIG
+                )
+            except Exception as e:
+                print(f"[ERRO] Erro ao conectar ao banco de dados: {e}")
+                import traceback
+                traceback.print_exc()
+                sys.exit(1)
+        return _pool_kpi
+
+@contextmanager
+def conexao_kpi():
+    """
+    Empresta uma conexão do pool (uma por thread)
+    Após erro a conexão é descartada: o registro de KPIs preparados poderia
+    não refletir mais o estado da sessão
+    """
+    pool = obter_pool_kpi()
+    conn = pool.getconn()
+    descartar = True
+    try:
+        yield conn
+        conn.rollback()
+        descartar = bool(conn.closed)
+    finally:
+        pool.putconn(conn, close=descartar)
+
+def fechar_pool_kpi():
+    """Fecha as conexões do pool ao fim da execução"""
+    global _pool_kpi
+    with _trava_pool_kpi:
+        if _pool_kpi is not None:
+            _pool_kpi.closeall()
+            _pool_kpi = None
+
+def comando_kpi(conn, num_kpi, query):
+    """
+    Comando de execução do KPI como prepared statement (parse/plan uma vez por sessão)
+    Na primeira vez PREPARE e EXECUTE seguem juntos, em uma única ida ao servidor
+    """
+    nome = f"kpi{num_kpi}"
+    if num_kpi in conn.kpis_preparados:
+        return f"EXECUTE {nome}"
+    return f"PREPARE {nome} AS {query}; EXECUTE {nome}"
+
+def executar_kpi(conn, num_kpi, query):
+    """
+    Executa um KPI na conexão informada, reaproveitando o plano já preparado
+    Retorna (colunas, registros) prontos para exibição
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(comando_kpi(conn, num_kpi, query))
+        registros = cursor.fetchall()
+        colunas = [desc.name for desc in cursor.description]
+    conn.kpis_preparados.add(num_kpi)
+    return colunas, registros
+
+def obter_versao_views(conn):
+    """
+    Retorna o instante do último refresh das views (dw.etl_meta)
+    None quando a tabela ainda não existe: os resultados não são cacheados
+    """
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT atualizado_em FROM dw.etl_meta WHERE chave = 'views_kpi'")
+            registro = cursor.fetchone()
+    except psycopg2.errors.UndefinedTable:
+        conn.rollback()
+        return None
+    conn.rollback()
+    return registro[0].isoformat() if registro else None
+
+def preparar_diretorio_cache():
+    """
+    Cria o diretório de cache com permissão 0700
+    None (sem cache) se ele pertencer a outro usuário ou for acessível por outros
+    """
+    try:
+        DIRETORIO_CACHE.mkdir(mode=0o700, parents=True, exist_ok=True)
+        estado = DIRETORIO_CACHE.stat()
+    except OSError:
+        return None
+    if hasattr(os, "getuid") and (estado.st_uid != os.getuid() or estado.st_mode & 0o077):
+        print(f"[AVISO] Cache ignorado: {DIRETORIO_CACHE} não é exclusivo do usuário")
+        return None
+    return DIRETORIO_CACHE
+
+def _codificar_valor(valor):
+    """Serializa em JSON os tipos do psycopg2 sem equivalente nativo"""
+    if isinstance(valor, Decimal):
+        return {"decimal": str(valor)}
+    if isinstance(valor, datetime):
+        return {"datetime": valor.isoformat()}
+    if isinstance(valor, date):
+        return {"date": valor.isoformat()}
+    raise TypeError(f"Tipo não suportado no cache: {type(valor).__name__}")
+
+def _decodificar_valor(objeto):
+    """Restaura os valores marcados por _codificar_valor"""
+    if len(objeto) == 1:
+        tipo, valor = next(iter(objeto.items()))
+        if tipo == "decimal":
+            return Decimal(valor)
+        if tipo == "datetime":
+            return datetime.fromisoformat(valor)
+        if tipo == "date":
+            return date.fromisoformat(valor)
+    return objeto
+
+def caminho_cache(diretorio, query):
+    """Arquivo de cache do KPI, identificado pelo hash do texto da query"""
+    chave = hashlib.blake2b(query.encode()).hexdigest()[:16]
+    return diretorio / f"{chave}.json"
+
+def ler_cache(diretorio, query, versao):
+    """
+    Retorna (colunas, registros) do cache se gravado na mesma versão das views
+    A versão fica na primeira linha: o resultado só é lido quando ela confere
+    """
+    if diretorio is None or versao is None:
+        return None
+    try:
+        with caminho_cache(diretorio, query).open(encoding="utf-8") as arquivo:
+            if json.loads(arquivo.readline()) != versao:
+                return None
+            conteudo = json.loads(arquivo.read(), object_hook=_decodificar_valor)
+    except (OSError, ValueError):
+        return None
+    return conteudo["colunas"], [tuple(registro) for registro in conteudo["registros"]]
+
+def gravar_cache(diretorio, query, versao, colunas, registros):
+    """Grava o resultado em arquivo temporário e renomeia (leitores nunca veem arquivo parcial)"""
+    if diretorio is None or versao is None:
+        return
+    descritor, temporario = tempfile.mkstemp(dir=diretorio, suffix=".tmp")
+    with os.fdopen(descritor, "w", encoding="utf-8") as arquivo:
+        arquivo.write(json.dumps(versao) + "\n")
+        json.dump(
+            {"colunas": list(colunas), "registros": [list(registro) for registro in registros]},
+            arquivo, default=_codificar_valor
+        )
+    os.replace(temporario, caminho_cache(diretorio, query))
+
+def consultar_kpi(num_kpi, query, versao=None, diretorio_cache=None):
+    """Executa uma query de KPI em conexão do pool (uma por thread) e grava o resultado no cache"""
+    with conexao_kpi() as conn:
+        colunas, registros = executar_kpi(conn, num_kpi, query)
+    gravar_cache(diretorio_cache, query, versao, colunas, registros)
+    return colunas, registros
+
+def refresh_all(conn):
+    """
+    Atualiza todas as views de KPI após uma carga do DW
+    CONCURRENTLY mantém as views legíveis durante o refresh; uma única transação
+    garante que os KPIs exibidos sejam da mesma carga
+    Todos os comandos seguem em um único envio ao servidor, junto com a nova
+    versão em dw.etl_meta (invalida o cache de resultados)
+    """
+    comandos = ";\n".join(
+        [f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}" for view in VIEWS_KPI]
+        + [
+            "INSERT INTO dw.etl_meta (chave, atualizado_em) VALUES ('views_kpi', CURRENT_TIMESTAMP) "
+            "ON CONFLICT (chave) DO UPDATE SET atualizado_em = EXCLUDED.atualizado_em"
+        ]
+    )
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute(comandos)
+    print(f"[OK] {len(VIEWS_KPI)} views de KPI atualizadas")
+
+def _coletar_varreduras(plano, varreduras):
+    """Percorre o plano JSON do EXPLAIN acumulando os nós de varredura"""
+    if "Scan" in plano["Node Type"]:
+        varreduras.add(f"{plano['Node Type']} ({plano.get('Index Name', plano.get('Relation Name'))})")
+    for subplano in plano.get("Plans", []):
+        _coletar_varreduras(subplano, varreduras)
+    return varreduras
+
+def _workers_planejados(plano):
+    """Maior número de workers planejados nos nós Gather do plano"""
+    return max(
+        [plano.get("Workers Planned", 0)]
+        + [_workers_planejados(subplano) for subplano in plano.get("Plans", [])]
+    )
+
+def verificar_uso_indices(conn):
+    """
+    Executa EXPLAIN (ANALYZE, BUFFERS) das consultas das views de KPI
+    com e sem seq scan, para conferir os índices de sql/create_kpi_indexes.sql,
+    o uso de JIT e os workers paralelos planejados
+    """
+    with conn.cursor() as cursor:
+        for view in VIEWS_KPI:
+            cursor.execute("SELECT pg_get_viewdef(%s::regclass)", (view,))
+            definicao = cursor.fetchone()[0].rstrip().rstrip(";")
+            
+            print(f"\n[INFO] {view}")
+            for seqscan in ("on", "off"):
+                cursor.execute(f"SET enable_seqscan = {seqscan}")
+                cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {definicao}")
+                resultado = cursor.fetchone()[0][0]
+                plano = resultado["Plan"]
+                buffers = plano.get("Shared Hit Blocks", 0) + plano.get("Shared Read Blocks", 0)
+                varreduras = ", ".join(sorted(_coletar_varreduras(plano, set())))
+                jit = "JIT" if "JIT" in resultado else "sem JIT"
+                workers = _workers_planejados(plano)
+                print(f"  enable_seqscan={seqscan:<3} | {resultado['Execution Time']:>10.1f} ms "
+                      f"| {buffers:>8} buffers | {jit:<7} | {workers} workers | {varreduras}")
+            cursor.execute("RESET enable_seqscan")
+    conn.rollback()
+
+def exibir_kpi(num_kpi, titulo, colunas, registros):
+    """Exibe os resultados de um KPI"""
     print(f"\n{'='*80}")
     print(f"KPI {num_kpi}: {titulo}")
     print(f"{'='*80}")
     
-    try:
-        df = pd.read_sql_query(query, conn)
-        
-        if df.empty:
-            print("[AVISO] Nenhum resultado encontrado")
-            return
-        
-        print(f"\n[INFO] Total de registros: {len(df)}")
-        print(f"\n{df.to_string(index=False)}")
-        
-    except Exception as e:
-        print(f"[ERRO] Erro ao executar KPI {num_kpi}: {e}")
+    if not registros:
+        print("[AVISO] Nenhum resultado encontrado")
+        return
+    
+    print(f"\n[INFO] Total de registros: {len(registros)}")
+    print(f"\n{tabulate(registros, headers=colunas, floatfmt='.2f')}")
 
 def main():
     """Função principal"""
@@ -62,283 +430,53 @@ def main():
     print(f"Data/Hora: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("="*80)
     
-    conn = conectar_db()
-    
-    # KPI 1: Margem de Contribuição Média por Produto
-    kpi1_query = """
-    SELECT 
-        p.categoria_produto,
-        p.subcategoria_produto,
-        p.nome_produto,
-        COUNT(DISTINCT fv.numero_pedido) AS total_pedidos,
-        SUM(fv.quantidade_vendida) AS quantidade_total_vendida,
-        SUM(fv.valor_liquido) AS receita_liquida,
-        SUM(fv.lucro_bruto) AS lucro_bruto,
-        ROUND(AVG(fv.margem_contribuicao), 2) AS margem_contribuicao_media_pct,
-        ROUND(SUM(fv.lucro_bruto) / NULLIF(SUM(fv.valor_liquido), 0) * 100, 2) AS rentabilidade_pct
-    FROM dw.fato_vendas fv
-    INNER JOIN dw.dim_produto p ON fv.sk_produto = p.sk_produto
-    WHERE fv.valor_liquido > 0
-    GROUP BY p.categoria_produto, p.subcategoria_produto, p.nome_produto
-    HAVING SUM(fv.valor_liquido) > 1000
-    ORDER BY margem_contribuicao_media_pct DESC
-    LIMIT 20;
-    """
-    executar_kpi(conn, "Margem de Contribuição Média por Produto", kpi1_query, 1)
-    
-    # KPI 2: Análise de Efetividade de Descontos
-    kpi2_query = """
-    SELECT 
-        CASE 
-            WHEN fv.percentual_desconto = 0 THEN 'Sem Desconto'
-            WHEN fv.percentual_desconto <= 10 THEN '1-10%'
-            WHEN fv.percentual_desconto <= 20 THEN '11-20%'
-            WHEN fv.percentual_desconto <= 30 THEN '21-30%'
-            ELSE 'Acima de 30%'
-        END AS faixa_desconto,
-        COUNT(*) AS numero_transacoes,
-        SUM(fv.quantidade_vendida) AS unidades_vendidas,
-        ROUND(SUM(fv.valor_bruto), 2) AS valor_bruto_total,
-        ROUND(SUM(fv.valor_desconto), 2) AS desconto_concedido,
-        ROUND(SUM(fv.valor_liquido), 2) AS receita_liquida,
-        ROUND(SUM(fv.lucro_bruto), 2) AS lucro_total,
-        ROUND(AVG(fv.margem_contribuicao), 2) AS margem_media_pct,
-        ROUND(SUM(fv.valor_desconto) / NULLIF(SUM(fv.valor_bruto), 0) * 100, 2) AS taxa_desconto_media_pct
-    FROM dw.fato_vendas fv
-    GROUP BY 1
-    ORDER BY 1;
-    """
-    executar_kpi(conn, "Análise de Efetividade de Descontos", kpi2_query, 2)
-    
-    # KPI 3: Performance de Vendedores por Região
-    kpi3_query = """
-    SELECT 
-        r.grupo_regional,
-        r.nome_territorio,
-        v.nome_vendedor,
-        v.meta_anual,
-        COUNT(DISTINCT fv.numero_pedido) AS total_vendas,
-        ROUND(SUM(fv.valor_liquido), 2) AS receita_gerada,
-        ROUND(SUM(fv.lucro_bruto), 2) AS lucro_gerado,
-        ROUND(SUM(fv.valor_liquido) / NULLIF(v.meta_anual, 0) * 100, 2) AS percentual_meta_atingido,
-        ROUND(SUM(fv.valor_liquido) / NULLIF(COUNT(DISTINCT fv.numero_pedido), 0), 2) AS ticket_medio_vendedor,
-        ROUND(AVG(fv.margem_contribuicao), 2) AS margem_media_pct
-    FROM dw.fato_vendas fv
-    INNER JOIN dw.dim_vendedor v ON fv.sk_vendedor = v.sk_vendedor
-    INNER JOIN dw.dim_regiao r ON fv.sk_regiao = r.sk_regiao
-    WHERE v.meta_anual > 0
-    GROUP BY r.grupo_regional, r.nome_territorio, v.nome_vendedor, v.meta_anual
-    ORDER BY receita_gerada DESC
-    LIMIT 15;
-    """
-    executar_kpi(conn, "Performance de Vendedores por Região", kpi3_query, 3)
-    
-    # KPI 4: Evolução Temporal de Receita
-    kpi4_query = """
-    WITH metricas_mensais AS (
-        SELECT 
-            t.ano,
-            t.mes,
-            t.nome_mes,
-            SUM(fv.valor_liquido) AS receita_mes,
-            SUM(fv.lucro_bruto) AS lucro_mes,
-            COUNT(DISTINCT fv.numero_pedido) AS pedidos_mes,
-            COUNT(DISTINCT fv.sk_cliente) AS clientes_unicos
-        FROM dw.fato_vendas fv
-        INNER JOIN dw.dim_tempo t ON fv.sk_tempo = t.sk_tempo
-        GROUP BY t.ano, t.mes, t.nome_mes
-    )
-    SELECT 
-        ano,
-        mes,
-        nome_mes,
-        ROUND(receita_mes, 2) AS receita_mensal,
-        ROUND(lucro_mes, 2) AS lucro_mensal,
-        ROUND(lucro_mes / NULLIF(receita_mes, 0) * 100, 2) AS margem_lucro_pct,
-        pedidos_mes,
-        clientes_unicos,
-        ROUND(receita_mes / NULLIF(pedidos_mes, 0), 2) AS ticket_medio
-    FROM metricas_mensais
-    ORDER BY ano DESC, mes DESC
-    LIMIT 12;
-    """
-    executar_kpi(conn, "Evolução Temporal de Receita e Lucratividade", kpi4_query, 4)
-    
-    # KPI 5: Análise ABC de Produtos
-    kpi5_query = """
-    WITH ranking_produtos AS (
-        SELECT 
-            p.sk_produto,
-            p.nome_produto,
-            p.categoria_produto,
-            SUM(fv.valor_liquido) AS receita_produto,
-            SUM(SUM(fv.valor_liquido)) OVER () AS receita_total,
-            SUM(fv.quantidade_vendida) AS quantidade_vendida
-        FROM dw.fato_vendas fv
-        INNER JOIN dw.dim_produto p ON fv.sk_produto = p.sk_produto
-        GROUP BY p.sk_produto, p.nome_produto, p.categoria_produto
-    ),
-    acumulado AS (
-        SELECT 
-            *,
-            SUM(receita_produto) OVER (ORDER BY receita_produto DESC) AS receita_acumulada,
-            ROUND(
-                SUM(receita_produto) OVER (ORDER BY receita_produto DESC) / 
-                NULLIF(receita_total, 0) * 100, 
-                2
-            ) AS percentual_acumulado
-        FROM ranking_produtos
-    )
-    SELECT 
-        nome_produto,
-        categoria_produto,
-        ROUND(receita_produto, 2) AS receita,
-        quantidade_vendida,
-        percentual_acumulado,
-        CASE 
-            WHEN percentual_acumulado <= 80 THEN 'A - Alto Valor'
-            WHEN percentual_acumulado <= 95 THEN 'B - Médio Valor'
-            ELSE 'C - Baixo Valor'
-        END AS classificacao_abc
-    FROM acumulado
-    ORDER BY receita_produto DESC
-    LIMIT 30;
-    """
-    executar_kpi(conn, "Análise ABC de Produtos", kpi5_query, 5)
-    
-    # KPI 6: Concentração Geográfica de Vendas
-    kpi6_query = """
-    SELECT 
-        r.continente,
-        r.grupo_regional,
-        r.nome_territorio,
-        COUNT(DISTINCT fv.sk_cliente) AS total_clientes,
-        COUNT(DISTINCT fv.numero_pedido) AS total_pedidos,
-        SUM(fv.quantidade_vendida) AS unidades_vendidas,
-        ROUND(SUM(fv.valor_liquido), 2) AS receita_total,
-        ROUND(SUM(fv.lucro_bruto), 2) AS lucro_total,
-        ROUND(AVG(fv.margem_contribuicao), 2) AS margem_media_pct,
-        ROUND(
-            SUM(fv.valor_liquido) / NULLIF(SUM(SUM(fv.valor_liquido)) OVER (), 0) * 100, 
-            2
-        ) AS participacao_receita_pct,
-        ROUND(SUM(fv.valor_liquido) / NULLIF(COUNT(DISTINCT fv.numero_pedido), 0), 2) AS ticket_medio_regiao
-    FROM dw.fato_vendas fv
-    INNER JOIN dw.dim_regiao r ON fv.sk_regiao = r.sk_regiao
-    GROUP BY r.continente, r.grupo_regional, r.nome_territorio
-    ORDER BY receita_total DESC
-    LIMIT 15;
-    """
-    executar_kpi(conn, "Concentração Geográfica de Vendas", kpi6_query, 6)
+    # Após uma nova carga do DW: python test_kpis.py --atualizar-views
+    if "--atualizar-views" in sys.argv:
+        conn = conectar_db(OPCOES_SESSAO_ANALITICA)
+        try:
+            refresh_all(conn)
+        finally:
+            conn.close()
     
-    # KPI 7: Eficiência Operacional por Categoria
-    kpi7_query = """
-    SELECT 
-        p.categoria_produto,
-        COUNT(DISTINCT p.sk_produto) AS total_produtos_categoria,
-        COUNT(DISTINCT fv.numero_pedido) AS total_transacoes,
-        SUM(fv.quantidade_vendida) AS unidades_vendidas,
-        ROUND(SUM(fv.valor_liquido), 2) AS receita_categoria,
-        ROUND(SUM(fv.custo_total), 2) AS custo_categoria,
-        ROUND(SUM(fv.lucro_bruto), 2) AS lucro_categoria,
-        ROUND(SUM(fv.lucro_bruto) / NULLIF(SUM(fv.valor_liquido), 0) * 100, 2) AS margem_lucro_pct,
-        ROUND(SUM(fv.valor_liquido) / NULLIF(COUNT(DISTINCT p.sk_produto), 0), 2) AS receita_media_produto,
-        ROUND(SUM(fv.quantidade_vendida) / NULLIF(COUNT(DISTINCT p.sk_produto), 0), 2) AS giro_medio_produto,
-        ROUND(
-            SUM(fv.valor_liquido) / NULLIF(SUM(SUM(fv.valor_liquido)) OVER (), 0) * 100, 
-            2
-        ) AS participacao_receita_total_pct
-    FROM dw.fato_vendas fv
-    INNER JOIN dw.dim_produto p ON fv.sk_produto = p.sk_produto
-    GROUP BY p.categoria_produto
-    ORDER BY receita_categoria DESC;
-    """
-    executar_kpi(conn, "Eficiência Operacional por Categoria", kpi7_query, 7)
+    if "--verificar-indices" in sys.argv:
+        conn = conectar_db(OPCOES_SESSAO_ANALITICA)
+        try:
+            verificar_uso_indices(conn)
+        finally:
+            conn.close()
     
-    # KPI 8: Customer Lifetime Value (CLV) por Segmento
-    kpi8_query = """
-    WITH metricas_cliente AS (
-        SELECT 
-            c.tipo_cliente,
-            c.segmento,
-            COUNT(DISTINCT fv.sk_cliente) AS total_clientes,
-            SUM(fv.valor_liquido) AS receita_total_segmento,
-            SUM(fv.lucro_bruto) AS lucro_total_segmento,
-            COUNT(DISTINCT fv.numero_pedido) AS total_pedidos,
-            AVG(fv.valor_liquido) AS ticket_medio
-        FROM dw.fato_vendas fv
-        INNER JOIN dw.dim_cliente c ON fv.sk_cliente = c.sk_cliente
-        GROUP BY c.tipo_cliente, c.segmento
-    )
-    SELECT 
-        tipo_cliente,
-        segmento,
-        total_clientes,
-        ROUND(receita_total_segmento, 2) AS receita_total,
-        ROUND(lucro_total_segmento, 2) AS lucro_total,
-        ROUND(receita_total_segmento / NULLIF(total_clientes, 0), 2) AS receita_media_por_cliente,
-        ROUND(lucro_total_segmento / NULLIF(total_clientes, 0), 2) AS lucro_medio_por_cliente,
-        ROUND(total_pedidos::NUMERIC / NULLIF(total_clientes, 0), 2) AS pedidos_por_cliente,
-        ROUND(ticket_medio, 2) AS ticket_medio,
-        CASE 
-            WHEN receita_total_segmento / NULLIF(total_clientes, 0) >= 50000 THEN 'VIP'
-            WHEN receita_total_segmento / NULLIF(total_clientes, 0) >= 20000 THEN 'Premium'
-            WHEN receita_total_segmento / NULLIF(total_clientes, 0) >= 5000 THEN 'Regular'
-            ELSE 'Basico'
-        END AS categoria_segmento
-    FROM metricas_cliente
-    ORDER BY receita_total DESC;
-    """
-    executar_kpi(conn, "Customer Lifetime Value por Segmento", kpi8_query, 8)
+    # Versão das views consultada uma vez em conexão simples (sem abrir o pool)
+    conn = conectar_db()
+    try:
+        versao = obter_versao_views(conn)
+    finally:
+        conn.close()
+    diretorio_cache = preparar_diretorio_cache() if versao else None
     
-    # KPI 9: Análise de Sazonalidade
-    kpi9_query = """
-    SELECT 
-        t.trimestre,
-        t.nome_dia_semana,
-        t.eh_fim_semana,
-        COUNT(DISTINCT fv.numero_pedido) AS total_vendas,
-        SUM(fv.quantidade_vendida) AS unidades_vendidas,
-        ROUND(SUM(fv.valor_liquido), 2) AS receita_total,
-        ROUND(AVG(fv.valor_liquido), 2) AS valor_medio_transacao,
-        ROUND(SUM(fv.lucro_bruto), 2) AS lucro_total,
-        ROUND(AVG(fv.margem_contribuicao), 2) AS margem_media_pct
-    FROM dw.fato_vendas fv
-    INNER JOIN dw.dim_tempo t ON fv.sk_tempo = t.sk_tempo
-    GROUP BY t.trimestre, t.nome_dia_semana, t.eh_fim_semana
-    ORDER BY t.trimestre, 
-        CASE t.nome_dia_semana
-            WHEN 'Monday' THEN 1
-            WHEN 'Tuesday' THEN 2
-            WHEN 'Wednesday' THEN 3
-            WHEN 'Thursday' THEN 4
-            WHEN 'Friday' THEN 5
-            WHEN 'Saturday' THEN 6
-            WHEN 'Sunday' THEN 7
-        END;
-    """
-    executar_kpi(conn, "Análise de Sazonalidade", kpi9_query, 9)
+    # KPIs já em cache nesta versão não vão ao banco
+    em_cache = {num_kpi: ler_cache(diretorio_cache, query, versao) for num_kpi, _, query in KPIS}
+    pendentes = [(num_kpi, query) for num_kpi, _, query in KPIS if em_cache[num_kpi] is None]
     
-    # KPI 10: Top 10 Produtos por Receita (Resumo Executivo)
-    kpi10_query = """
-    SELECT 
-        p.categoria_produto,
-        p.nome_produto,
-        COUNT(DISTINCT fv.numero_pedido) AS total_pedidos,
-        SUM(fv.quantidade_vendida) AS quantidade_vendida,
-        ROUND(SUM(fv.valor_liquido), 2) AS receita_total,
-        ROUND(SUM(fv.lucro_bruto), 2) AS lucro_total,
-        ROUND(AVG(fv.margem_contribuicao), 2) AS margem_media_pct,
-        ROUND(SUM(fv.valor_liquido) / NULLIF(SUM(fv.quantidade_vendida), 0), 2) AS preco_medio_unitario
-    FROM dw.fato_vendas fv
-    INNER JOIN dw.dim_produto p ON fv.sk_produto = p.sk_produto
-    GROUP BY p.categoria_produto, p.nome_produto
-    ORDER BY receita_total DESC
-    LIMIT 10;
-    """
-    executar_kpi(conn, "Top 10 Produtos por Receita", kpi10_query, 10)
+    # KPIs restantes: cada um em sua conexão do pool, executados simultaneamente
+    with ThreadPoolExecutor(max_workers=max(1, min(len(pendentes), MAX_CONEXOES_KPI))) as executor:
+        futuros = {
+            num_kpi: executor.submit(consultar_kpi, num_kpi, query, versao, diretorio_cache)
+            for num_kpi, query in pendentes
+        }
+        
+        # Exibe na ordem original, à medida que cada resultado fica pronto
+        for num_kpi, titulo, _ in KPIS:
+            if num_kpi not in futuros:
+                colunas, registros = em_cache[num_kpi]
+            else:
+                try:
+                    colunas, registros = futuros[num_kpi].result()
+                except Exception as e:
+                    print(f"\n[ERRO] Erro ao executar KPI {num_kpi}: {e}")
+                    continue
+            exibir_kpi(num_kpi, titulo, colunas, registros)
     
-    conn.close()
+    fechar_pool_kpi()
     
     print("\n" + "="*80)
     print("[OK] TESTE DE KPIs CONCLUIDO COM SUCESSO!")